@@ -58,21 +58,27 @@ import hashlib
 import html as html_lib
 import time
 import base64
+import gzip
+import quopri
 import uuid
+import signal
 import socket
+import threading
 from datetime import datetime, timedelta, timezone
 from email.parser import BytesParser
 from email.policy import default
+from functools import lru_cache
 from http.cookies import SimpleCookie
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from io import BytesIO
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, Optional
 
 import db
 import notifications
 import requests
 import sms_provider
+import swish_client
 from config import runtime
 from qrcodegen import QrCode
 from swish_client import SwishClient, SwishConfig
@@ -108,12 +114,16 @@ REPORT_RATE_LIMIT_WINDOW_SECONDS = 15 * 60
 REPORT_RATE_LIMIT_MAX_SUBMITS = 5
 REPORT_RATE_LIMIT_BY_IP: Dict[str, list[float]] = {}
 MIN_WEBHOOK_SECRET_LENGTH = 32
+# On shutdown, wait this long for queued receipt webhooks: at least one
+# whole send, plus a margin for the database writes around it.
+WEBHOOK_DRAIN_TIMEOUT_SECONDS = notifications.WEBHOOK_DEADLINE_SECONDS + 8
 CONFIRM_LINK_MAX_AGE_SECONDS = 60 * 60 * 24 * 45
 
 
 def process_due_test_bookings(*, now: Optional[datetime] = None) -> Dict[str, int]:
     """Process ephemeral test bookings (SMS dispatch and auto-delete)."""
     effective_now = now or datetime.now()
+    now_iso = effective_now.isoformat(timespec="seconds")
     processed_paid = 0
 
     due_paid = db.get_due_test_bookings_for_auto_paid(effective_now)
@@ -137,19 +147,62 @@ def process_due_test_bookings(*, now: Optional[datetime] = None) -> Dict[str, in
                     f"TEST bokning PAID: {booking_reference} | {trailer_type} | {rental_type} | {price} kr"
                 )
                 if sms_provider.send_sms(admin_number, admin_msg):
-                    db.mark_test_sms_admin_sent(test_booking_id, sent_at=effective_now.isoformat(timespec="seconds"))
+                    db.mark_test_sms_admin_sent(test_booking_id, sent_at=now_iso)
 
         if row.get("sms_target_temp") and row.get("sms_target_sent_at") is None:
             target_msg = (
                 f"Dalsjofors Hyrservice AB: TEST bokningskvitto {booking_reference} | {trailer_type} | {rental_type} | {price} kr"
             )
             if sms_provider.send_sms(str(row.get("sms_target_temp")), target_msg):
-                db.mark_test_sms_target_sent(test_booking_id, sent_at=effective_now.isoformat(timespec="seconds"))
+                db.mark_test_sms_target_sent(test_booking_id, sent_at=now_iso)
 
     deleted = db.delete_due_test_bookings(effective_now)
     return {"processedPaid": processed_paid, "deleted": deleted}
 
 
+def _deliver_receipt_webhook(booking_id: int, booking: Dict[str, Any], lock_at: str) -> None:
+    """Send a receipt webhook claimed at ``lock_at``; runs on the notifications worker."""
+    # The job may have waited in the queue long enough for its claim to go
+    # stale and be taken over; only the current claim holder may send.
+    if not db.holds_receipt_webhook_lock(booking_id, lock_at):
+        logger.info("RECEIPT_WEBHOOK_SKIP reason=claim_lost bookingId=%s", booking_id)
+        return
+
+    def _record_failure(payload: Dict[str, Any], status_code: int, error: str) -> None:
+        # The customer email stays only in customer_email_temp, which is
+        # cleared on send, cancel and expiry; the stored copy omits it.
+        stored = {key: value for key, value in payload.items() if key != "customerEmail"}
+        db.record_webhook_failure(booking_id, json.dumps(stored, ensure_ascii=False), status_code, error)
+
+    delivered = False
+    try:
+        delivered = notifications.send_receipt_webhook(booking, on_failure=_record_failure)
+    finally:
+        # Release even if recording the failure raised, so the next trigger
+        # can retry instead of waiting for the lock to go stale.
+        if delivered:
+            db.finalize_receipt_webhook_send(booking_id, lock_at)
+        else:
+            db.release_receipt_webhook_lock(booking_id, lock_at)
+
+
+def _swish_config_from_env(callback_url: str) -> SwishConfig:
+    """Build the Swish client config from the environment.
+
+    Shared by request handlers and the startup warm-up so both resolve the
+    same certificate paths, and therefore the same pooled mTLS connection.
+    """
+    return SwishConfig(
+        base_url=runtime.swish_api_url(),
+        merchant_alias=runtime.swish_merchant_alias(),
+        callback_url=callback_url,
+        cert_path=runtime.swish_cert_path() or None,
+        key_path=runtime.swish_key_path() or None,
+        ca_path=runtime.swish_ca_path() or None,
+        mock=runtime.swish_mode() == "mock",
+    )
+
+
 def _debug_swish_enabled() -> bool:
     return (os.environ.get("DEBUG_SWISH") or "").strip() == "1"
 
@@ -190,41 +243,157 @@ def get_admin_session_secret() -> str:
     return runtime.admin_session_secret()
 
 
+@lru_cache(maxsize=4)
+def _admin_password_hash(password: str) -> str:
+    """Hex SHA-256 of the admin password as embedded in session cookies."""
+    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+
+
 def _constant_time_secret_match(provided_value: str, expected_value: str) -> bool:
     provided_hash = hashlib.sha256(provided_value.encode("utf-8")).digest()
     expected_hash = hashlib.sha256(expected_value.encode("utf-8")).digest()
     return hmac.compare_digest(provided_hash, expected_hash)
 
 
+def _render_qr_svg(payload: str, size: int = 320, border: int = 2) -> str:
+    """Render ``payload`` as a QR code SVG."""
+    qr = QrCode.encode_text(payload, QrCode.Ecc.MEDIUM)
+    qr_size = qr.get_size()
+    scale = max(1, size // (qr_size + border * 2))
+    canvas = (qr_size + border * 2) * scale
+    rects = []
+    # One rect per horizontal run of dark modules instead of per module.
+    for y in range(qr_size):
+        x = 0
+        while x < qr_size:
+            if not qr.get_module(x, y):
+                x += 1
+                continue
+            run_start = x
+            while qr.get_module(x, y):  # False past the right edge
+                x += 1
+            rects.append(
+                f'<rect x="{(run_start + border) * scale}" y="{(y + border) * scale}" '
+                f'width="{(x - run_start) * scale}" height="{scale}"/>'
+            )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {canvas} {canvas}" '
+        f'width="{size}" height="{size}" role="img" aria-label="Swish QR">'
+        '<rect width="100%" height="100%" fill="#fff"/>'
+        '<g fill="#000">'
+        + "".join(rects)
+        + "</g></svg>"
+    )
+
+
+@lru_cache(maxsize=128)
+def _qr_svg_bodies(payload: str, size: int = 320) -> tuple[bytes, bytes]:
+    """Return the QR SVG for ``payload`` as UTF-8 bytes and gzipped bytes.
+
+    Cached per payload: the pay page and its reloads request the same
+    booking's QR repeatedly, and encoding dominates the cost.
+    """
+    body = _render_qr_svg(payload, size=size).encode("utf-8")
+    return body, gzip.compress(body, compresslevel=6)
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Return True if an Accept-Encoding header allows gzip (not ``q=0``)."""
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() != "gzip":
+            continue
+        _, _, quality = params.partition("q=")
+        try:
+            return float(quality) > 0 if quality.strip() else True
+        except ValueError:
+            return False
+    return False
+
+
 def parse_query(query: str) -> Dict[str, str]:
     """Parse a URL query string into a dict of first values."""
     parsed = urllib.parse.parse_qs(query, keep_blank_values=True)
     return {k: v[0] for k, v in parsed.items() if v}
 
 
+_HEADER_PARSER = BytesParser(policy=default)
+
+
+def _iter_multipart_parts(body: bytes, boundary: bytes) -> Iterator[tuple[bytes, memoryview]]:
+    """Yield ``(header_bytes, content)`` for each part of a multipart body.
+
+    Parts are located with ``bytes.find`` and returned as ``memoryview``
+    slices of ``body``, so uploaded files are not copied while scanning.
+    Line endings are CRLF per RFC 2046, but bodies using bare LF are accepted
+    too; the first delimiter line decides which one the body uses.
+    """
+    delimiter = b"--" + boundary
+    next_part = body.find(delimiter)
+    if next_part == -1:
+        raise ValueError("invalid_multipart")
+    first_line_end = body.find(b"\n", next_part)
+    eol = b"\n" if first_line_end != -1 and body[first_line_end - 1] != 0x0D else b"\r\n"
+    blank_line = eol + eol
+    view = memoryview(body)
+    while True:
+        pos = next_part + len(delimiter)
+        if body.startswith(b"--", pos):
+            return
+        line_end = body.find(eol, pos)
+        if line_end == -1:
+            return
+        part_start = line_end + len(eol)
+        next_part = body.find(eol + delimiter, part_start)
+        part_end = len(body) if next_part == -1 else next_part
+        if body.startswith(eol, part_start):
+            yield b"", view[part_start + len(eol) : part_end]
+        else:
+            header_end = body.find(blank_line, part_start, part_end)
+            if header_end == -1:
+                yield body[part_start:part_end], view[part_end:part_end]
+            else:
+                yield body[part_start:header_end], view[header_end + len(blank_line) : part_end]
+        if next_part == -1:
+            return
+        next_part += len(eol)
+
+
+def _decode_part_content(part: Any, content: memoryview) -> bytes:
+    transfer_encoding = str(part.get("Content-Transfer-Encoding") or "").strip().lower()
+    if transfer_encoding == "base64":
+        return base64.b64decode(bytes(content))
+    if transfer_encoding == "quoted-printable":
+        return quopri.decodestring(bytes(content))
+    return bytes(content)
+
+
 def parse_form_data(content_type: str, body: bytes) -> tuple[dict[str, str], list[dict[str, Any]]]:
     """Parse multipart or urlencoded form data without third-party dependencies."""
     normalized_content_type = (content_type or "").strip()
     lowered = normalized_content_type.lower()
 
     if lowered.startswith("multipart/form-data"):
-        pseudo = (
-            b"Content-Type: "
-            + normalized_content_type.encode("utf-8", errors="ignore")
-            + b"\r\nMIME-Version: 1.0\r\n\r\n"
-            + body
-        )
+        # Only headers go through the email parser; part bodies are sliced
+        # straight out of ``body`` (see _iter_multipart_parts).
         try:
-            message = BytesParser(policy=default).parsebytes(pseudo)
+            content_type_header = _HEADER_PARSER.parsebytes(
+                b"Content-Type: " + normalized_content_type.encode("utf-8", errors="ignore") + b"\r\n\r\n",
+                headersonly=True,
+            )
+            boundary = content_type_header.get_boundary()
         except Exception as exc:
             raise ValueError("could_not_parse_multipart") from exc
-
-        if not message.is_multipart():
+        if not boundary:
             raise ValueError("invalid_multipart")
 
         fields: dict[str, str] = {}
         files: list[dict[str, Any]] = []
-        for part in message.iter_parts():
+        for header_bytes, content in _iter_multipart_parts(body, boundary.encode("utf-8", errors="ignore")):
+            try:
+                part = _HEADER_PARSER.parsebytes(header_bytes + b"\r\n\r\n", headersonly=True)
+            except Exception as exc:
+                raise ValueError("could_not_parse_multipart") from exc
             if part.get_content_disposition() != "form-data":
                 continue
 
@@ -233,7 +402,7 @@ def parse_form_data(content_type: str, body: bytes) -> tuple[dict[str, str], lis
                 continue
 
             filename = part.get_filename()
-            payload = part.get_payload(decode=True) or b""
+            payload = _decode_part_content(part, content)
             if filename:
                 files.append(
                     {
@@ -331,8 +500,7 @@ class Handler(BaseHTTPRequestHandler):
         if not secret:
             return None
         expires_at = int(time.time()) + ADMIN_SESSION_MAX_AGE_SECONDS
-        password_hash = hashlib.sha256(expected_password.encode("utf-8")).hexdigest()
-        payload = f"v1|{expires_at}|{password_hash}"
+        payload = f"v1|{expires_at}|{_admin_password_hash(expected_password)}"
         signature = hmac.new(secret.encode("utf-8"), payload.encode("utf-8"), hashlib.sha256).hexdigest()
         payload_b64 = base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
         return f"{payload_b64}.{signature}"
@@ -387,7 +555,7 @@ class Handler(BaseHTTPRequestHandler):
             payload = payload_bytes.decode("utf-8")
         except Exception:
             return False
-        expected_sig = hmac.new(secret.encode("utf-8"), payload.encode("utf-8"), hashlib.sha256).hexdigest()
+        expected_sig = hmac.new(secret.encode("utf-8"), payload_bytes, hashlib.sha256).hexdigest()
         if not hmac.compare_digest(signature, expected_sig):
             return False
         parts = payload.split("|")
@@ -399,8 +567,7 @@ class Handler(BaseHTTPRequestHandler):
             return False
         if int(time.time()) > expires_at:
             return False
-        expected_password_hash = hashlib.sha256(expected_password.encode("utf-8")).hexdigest()
-        return hmac.compare_digest(parts[2], expected_password_hash)
+        return hmac.compare_digest(parts[2], _admin_password_hash(expected_password))
 
     def _admin_login_html(self, *, error_message: Optional[str] = None) -> bytes:
         escaped_error = html_lib.escape(error_message) if error_message else ""
@@ -785,6 +952,7 @@ class Handler(BaseHTTPRequestHandler):
         if swish_status != "PAID":
             return
 
+        now_iso = datetime.now().isoformat(timespec="seconds")
         booking_ref = booking.get("booking_reference") or f"BOOKING-{booking_id}"
         trailer_label = self._trailer_label(booking.get("trailer_type") or "")
         period_label = self._booking_period_label(booking)
@@ -797,7 +965,7 @@ class Handler(BaseHTTPRequestHandler):
                     f"Ny bokning PAID: {booking_ref} | {trailer_label} | {period_label} | {price_label}"
                 )
                 if sms_provider.send_sms(admin_number, admin_message):
-                    db.mark_sms_admin_sent(booking_id)
+                    db.mark_sms_admin_sent(booking_id, sent_at=now_iso)
 
         booking = db.get_booking_by_id(booking_id) or booking
         customer_phone = booking.get("customer_phone_temp")
@@ -807,23 +975,9 @@ class Handler(BaseHTTPRequestHandler):
                 f"{period_label} | {price_label} | Betalning: PAID"
             )
             if sms_provider.send_sms(customer_phone, customer_message):
-                db.mark_sms_customer_sent(booking_id)
-                db.clear_customer_phone_temp(booking_id)
+                db.mark_sms_customer_sent(booking_id, sent_at=now_iso)
 
-        booking = db.get_booking_by_id(booking_id) or booking
-        receipt_booking = booking
-        required_receipt_fields = (
-            "id",
-            "booking_reference",
-            "trailer_type",
-            "start_dt",
-            "end_dt",
-            "price",
-            "customer_email_temp",
-            "receipt_requested_temp",
-        )
-        if any(receipt_booking.get(field) in (None, "") for field in required_receipt_fields):
-            receipt_booking = db.get_booking_by_id(booking_id) or receipt_booking
+        receipt_booking = db.get_booking_by_id(booking_id) or booking
         booking_reference = receipt_booking.get("booking_reference")
         if str(booking_reference or "").startswith("TEST-"):
             logger.info(
@@ -848,18 +1002,14 @@ class Handler(BaseHTTPRequestHandler):
                 booking_reference,
             )
             return
-        if not db.claim_receipt_webhook_send(booking_id):
+        if not db.claim_receipt_webhook_send(booking_id, lock_at=now_iso):
             logger.info(
                 "RECEIPT_WEBHOOK_SKIP reason=already_inflight_or_sent bookingId=%s bookingReference=%s",
                 booking_id,
                 booking_reference,
             )
             return
-        if notifications.send_receipt_webhook(receipt_booking):
-            db.mark_receipt_webhook_sent(booking_id)
-            db.clear_receipt_temp_fields(booking_id)
-            return
-        db.release_receipt_webhook_lock(booking_id)
+        notifications.submit_webhook(lambda: _deliver_receipt_webhook(booking_id, receipt_booking, now_iso))
 
     def _parse_iso_datetime_field(self, field_name: str, raw_value: Optional[str]) -> Optional[datetime]:
         value = (raw_value or "").strip()
@@ -1248,17 +1398,7 @@ class Handler(BaseHTTPRequestHandler):
         return runtime.swish_mode()
 
     def _swish_client(self) -> SwishClient:
-        return SwishClient(
-            SwishConfig(
-                base_url=runtime.swish_api_url(),
-                merchant_alias=runtime.swish_merchant_alias(),
-                callback_url=self._swish_callback_url(),
-                cert_path=runtime.swish_cert_path() or None,
-                key_path=runtime.swish_key_path() or None,
-                ca_path=runtime.swish_ca_path() or None,
-                mock=self._swish_mode() == "mock",
-            )
-        )
+        return SwishClient(_swish_config_from_env(self._swish_callback_url()))
 
     def _swish_callback_url(self) -> str:
         configured = runtime.swish_callback_url()
@@ -1401,9 +1541,9 @@ class Handler(BaseHTTPRequestHandler):
 
         db.set_swish_payment_request(
             booking_id,
-            instruction_uuid=created["instruction_uuid"],
-            token=created["token"],
-            request_id=created["request_id"],
+            instruction_uuid=created.instruction_uuid,
+            token=created.token,
+            request_id=created.instruction_uuid,
             status="PENDING",
             created_at=now_iso,
             updated_at=now_iso,
@@ -1597,10 +1737,15 @@ class Handler(BaseHTTPRequestHandler):
             return self.api_error(404, "not_found", "Swish token not found for booking", legacy_error="Swish token not found")
 
         qr_payload = self._swish_build_app_url(token)
-        svg = self._render_qr_svg(qr_payload, size=320)
-        body = svg.encode("utf-8")
+        body, gzipped = _qr_svg_bodies(qr_payload, size=320)
+        use_gzip = _accepts_gzip(self.headers.get("Accept-Encoding", ""))
+        if use_gzip:
+            body = gzipped
         self.send_response(200)
         self.send_header("Content-Type", "image/svg+xml; charset=utf-8")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Vary", "Accept-Encoding")
         self.send_header("Content-Length", str(len(body)))
         self.send_header("Cache-Control", "no-store")
         self.send_header("X-Request-Id", self._request_id())
@@ -1621,28 +1766,6 @@ class Handler(BaseHTTPRequestHandler):
             "</svg>"
         )
 
-    def _render_qr_svg(self, payload: str, size: int = 320, border: int = 2) -> str:
-        qr = QrCode.encode_text(payload, QrCode.Ecc.MEDIUM)
-        qr_size = qr.get_size()
-        scale = max(1, size // (qr_size + border * 2))
-        canvas = (qr_size + border * 2) * scale
-        rects = []
-        for y in range(qr_size):
-            for x in range(qr_size):
-                if qr.get_module(x, y):
-                    rects.append(
-                        f'<rect x="{(x + border) * scale}" y="{(y + border) * scale}" '
-                        f'width="{scale}" height="{scale}"/>'
-                    )
-        return (
-            f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {canvas} {canvas}" '
-            f'width="{size}" height="{size}" role="img" aria-label="Swish QR">'
-            '<rect width="100%" height="100%" fill="#fff"/>'
-            '<g fill="#000">'
-            + "".join(rects)
-            + "</g></svg>"
-        )
-
     def handle_admin_bookings(self, params: Dict[str, str]) -> None:
         """Return booking rows for admin tooling."""
         status = params.get("status")
@@ -2271,14 +2394,17 @@ class Handler(BaseHTTPRequestHandler):
         if booking_ref:
             payload["bookingRef"] = booking_ref
 
-        payload_size = len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
-        if payload_size > REPORT_MAX_WEBHOOK_PAYLOAD_BYTES and attachments_payload:
+        # Serialize once: the same bytes are size-checked and sent, so the
+        # base64 attachments are not re-encoded by requests' json=.
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        if len(body) > REPORT_MAX_WEBHOOK_PAYLOAD_BYTES and attachments_payload:
             payload["attachments"] = []
             payload["attachmentNames"] = []
             payload["attachmentCount"] = 0
             too_large_message = "Bilder kunde inte bifogas pga storlek, be kunden skicka separat"
             payload["message"] = f"{message_text}\n\n{too_large_message}" if message_text else too_large_message
-        approx_payload_size = len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        approx_payload_size = len(body)
 
         try:
             logger.warning(
@@ -2289,7 +2415,12 @@ class Handler(BaseHTTPRequestHandler):
                 len(payload.get("attachments", [])),
                 approx_payload_size,
             )
-            resp = requests.post(webhook_url, json=payload, timeout=15)
+            resp = requests.post(
+                webhook_url,
+                data=body,
+                headers={"Content-Type": "application/json; charset=utf-8"},
+                timeout=15,
+            )
             logger.warning(
                 "REPORT_WEBHOOK_RESPONSE status=%s body_snippet=%s",
                 resp.status_code,
@@ -2983,9 +3114,9 @@ class Handler(BaseHTTPRequestHandler):
             created = self._swish_client().create_payment_request(amount, f"DHS {booking_ref}", self._swish_callback_url())
             db.set_swish_payment_request(
                 booking_id,
-                instruction_uuid=created["instruction_uuid"],
-                token=created["token"],
-                request_id=created["request_id"],
+                instruction_uuid=created.instruction_uuid,
+                token=created.token,
+                request_id=created.instruction_uuid,
                 status="PENDING",
                 created_at=now_iso,
                 updated_at=now_iso,
@@ -3075,10 +3206,22 @@ def run() -> None:
             raise RuntimeError(
                 f"WEBHOOK_SECRET must be at least {MIN_WEBHOOK_SECRET_LENGTH} characters in production environments"
             )
+    if runtime.swish_mode() != "mock":
+        swish_client.warm_up(_swish_config_from_env(runtime.swish_callback_url()))
     port = runtime.port()
     server = HTTPServer(("0.0.0.0", port), Handler)
+    # Hosting platforms stop the service with SIGTERM; end serve_forever()
+    # cleanly instead so queued receipt webhooks get a chance to finish.
+    signal.signal(signal.SIGTERM, lambda *_args: threading.Thread(target=server.shutdown).start())
     print(f"Running Dalsjöfors Hyrservice on http://localhost:{port}")
-    server.serve_forever()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if not notifications.drain_webhook_queue(WEBHOOK_DRAIN_TIMEOUT_SECONDS):
+            logger.warning("WEBHOOK_DRAIN_TIMEOUT unsent receipts are retried once their send lock goes stale")
 
 
 if __name__ == "__main__":
@@ -48,6 +48,9 @@ from config import runtime
 
 DB_PATH = runtime.db_path(Path(__file__).resolve().parent / "database.db")
 PENDING_PAYMENT_EXPIRATION_MINUTES = 15
+# A receipt webhook claim older than this is treated as abandoned (e.g. the
+# process died with the job still queued) and may be claimed again.
+RECEIPT_WEBHOOK_LOCK_TIMEOUT_MINUTES = 10
 TRAILERS_PER_TYPE = 2
 SWISH_PENDING_STATUSES = {"PENDING", "CREATED"}
 SWISH_FAILED_STATUSES = {"FAILED", "CANCELLED", "ERROR", "EXPIRED"}
@@ -166,6 +169,21 @@ def init_db() -> None:
         );
         """
     )
+    # Latest failed receipt webhook per booking, kept for manual replay.
+    # The payload is stored without the customer email; rows are deleted
+    # once the receipt is sent or the booking is cancelled.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS webhook_failures (
+            booking_id   INTEGER PRIMARY KEY,
+            payload_json TEXT NOT NULL,
+            attempts     INTEGER NOT NULL DEFAULT 1,
+            last_status  INTEGER NOT NULL,
+            last_error   TEXT,
+            failed_at    TEXT NOT NULL
+        );
+        """
+    )
     # Optional meta table for future schema versioning
     conn.execute(
         """
@@ -654,6 +672,7 @@ def cancel_booking(booking_id: int) -> None:
             """,
             (booking_id,),
         )
+        conn.execute("DELETE FROM webhook_failures WHERE booking_id = ?", (booking_id,))
         conn.commit()
     finally:
         conn.close()
@@ -720,6 +739,7 @@ def expire_outdated_bookings(now: Optional[datetime] = None) -> int:
             """,
             tuple(cancel_ids),
         )
+        conn.execute(f"DELETE FROM webhook_failures WHERE booking_id IN ({placeholders})", tuple(cancel_ids))
         conn.commit()
         _debug_swish_log(
             "expire_outdated_bookings.updated",
@@ -885,14 +905,19 @@ def mark_sms_admin_sent(booking_id: int, *, sent_at: Optional[str] = None) -> bo
 
 
 def mark_sms_customer_sent(booking_id: int, *, sent_at: Optional[str] = None) -> bool:
-    """Mark customer SMS as sent, only once."""
+    """Mark customer SMS as sent, only once.
+
+    The temporary customer phone number is cleared in the same statement
+    (GDPR minimization) since it is not needed once the receipt is sent.
+    """
     effective_sent_at = sent_at or datetime.now().isoformat(timespec="seconds")
     conn = sqlite3.connect(DB_PATH)
     try:
         cur = conn.execute(
             """
             UPDATE bookings
-            SET sms_customer_sent_at = ?
+            SET sms_customer_sent_at = ?,
+                customer_phone_temp = NULL
             WHERE id = ?
               AND sms_customer_sent_at IS NULL
             """,
@@ -904,55 +929,110 @@ def mark_sms_customer_sent(booking_id: int, *, sent_at: Optional[str] = None) ->
         conn.close()
 
 
-def clear_customer_phone_temp(booking_id: int) -> None:
-    """Delete temporary customer phone number (GDPR minimization)."""
+def finalize_receipt_webhook_send(booking_id: int, lock_at: str, *, sent_at: Optional[str] = None) -> bool:
+    """Mark a claimed receipt webhook as sent and clear receipt temp fields.
+
+    Only succeeds while the caller still holds the send lock it took with
+    ``claim_receipt_webhook_send(booking_id, lock_at=lock_at)``.
+    """
+    effective_sent_at = sent_at or datetime.now().isoformat(timespec="seconds")
     conn = sqlite3.connect(DB_PATH)
     try:
-        conn.execute(
+        cur = conn.execute(
             """
             UPDATE bookings
-            SET customer_phone_temp = NULL
+            SET receipt_webhook_sent_at = ?,
+                receipt_webhook_lock_at = NULL,
+                customer_email_temp = NULL,
+                receipt_requested_temp = 0
             WHERE id = ?
+              AND receipt_webhook_sent_at IS NULL
+              AND receipt_webhook_lock_at = ?
             """,
-            (booking_id,),
+            (effective_sent_at, booking_id, lock_at),
         )
+        if cur.rowcount > 0:
+            # Delivered now; earlier dead letters (and their customer email)
+            # have nothing left to replay.
+            conn.execute("DELETE FROM webhook_failures WHERE booking_id = ?", (booking_id,))
         conn.commit()
+        return cur.rowcount > 0
     finally:
         conn.close()
 
 
-def clear_receipt_temp_fields(booking_id: int) -> None:
-    """Delete temporary customer receipt fields after successful webhook."""
+def record_webhook_failure(
+    booking_id: int,
+    payload_json: str,
+    last_status: int,
+    last_error: str,
+    *,
+    failed_at: Optional[str] = None,
+) -> int:
+    """Store or update the failed receipt webhook for a booking.
+
+    Keeps one row per booking: later failures overwrite the payload and
+    last error and bump ``attempts``.  ``last_status`` is 0 when no HTTP
+    response was received.  Returns the attempt count.
+    """
+    effective_failed_at = failed_at or datetime.now().isoformat(timespec="seconds")
     conn = sqlite3.connect(DB_PATH)
     try:
         conn.execute(
             """
-            UPDATE bookings
-            SET customer_email_temp = NULL,
-                receipt_requested_temp = 0
-            WHERE id = ?
+            INSERT INTO webhook_failures (booking_id, payload_json, last_status, last_error, failed_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (booking_id) DO UPDATE SET
+                payload_json = excluded.payload_json,
+                attempts = attempts + 1,
+                last_status = excluded.last_status,
+                last_error = excluded.last_error,
+                failed_at = excluded.failed_at
             """,
-            (booking_id,),
+            (booking_id, payload_json, int(last_status), last_error, effective_failed_at),
         )
+        row = conn.execute("SELECT attempts FROM webhook_failures WHERE booking_id = ?", (booking_id,)).fetchone()
         conn.commit()
+        return int(row[0])
     finally:
         conn.close()
 
 
-def mark_receipt_webhook_sent(booking_id: int, *, sent_at: Optional[str] = None) -> bool:
-    """Atomically mark receipt webhook as sent once per booking."""
-    effective_sent_at = sent_at or datetime.now().isoformat(timespec="seconds")
+def get_webhook_failure(booking_id: int) -> Optional[dict]:
+    """Return the stored receipt webhook failure for a booking, if any."""
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    try:
+        row = conn.execute(
+            "SELECT * FROM webhook_failures WHERE booking_id = ?",
+            (booking_id,),
+        ).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def claim_receipt_webhook_send(booking_id: int, *, lock_at: Optional[str] = None) -> bool:
+    """Atomically claim receipt webhook send lock for one in-flight sender.
+
+    A lock older than ``RECEIPT_WEBHOOK_LOCK_TIMEOUT_MINUTES`` is stale and
+    can be taken over, so a claim lost with its job is eventually retried.
+    """
+    effective_lock_at = lock_at or datetime.now().isoformat(timespec="seconds")
+    stale_before = (
+        datetime.fromisoformat(effective_lock_at) - timedelta(minutes=RECEIPT_WEBHOOK_LOCK_TIMEOUT_MINUTES)
+    ).isoformat(timespec="seconds")
     conn = sqlite3.connect(DB_PATH)
     try:
         cur = conn.execute(
             """
             UPDATE bookings
-            SET receipt_webhook_sent_at = ?,
-                receipt_webhook_lock_at = NULL
+            SET receipt_webhook_lock_at = ?
             WHERE id = ?
+              AND (receipt_webhook_lock_at IS NULL OR receipt_webhook_lock_at < ?)
               AND receipt_webhook_sent_at IS NULL
             """,
-            (effective_sent_at, booking_id),
+            (effective_lock_at, booking_id, stale_before),
         )
         conn.commit()
         return cur.rowcount > 0
@@ -960,29 +1040,31 @@ def mark_receipt_webhook_sent(booking_id: int, *, sent_at: Optional[str] = None)
         conn.close()
 
 
-def claim_receipt_webhook_send(booking_id: int, *, lock_at: Optional[str] = None) -> bool:
-    """Atomically claim receipt webhook send lock for one in-flight sender."""
-    effective_lock_at = lock_at or datetime.now().isoformat(timespec="seconds")
+def holds_receipt_webhook_lock(booking_id: int, lock_at: str) -> bool:
+    """Return True while the ``lock_at`` claim is still current and unsent.
+
+    A claim can be taken over once it goes stale, so a queued sender checks
+    this right before posting.
+    """
     conn = sqlite3.connect(DB_PATH)
     try:
-        cur = conn.execute(
+        row = conn.execute(
             """
-            UPDATE bookings
-            SET receipt_webhook_lock_at = ?
+            SELECT 1
+            FROM bookings
             WHERE id = ?
-              AND receipt_webhook_lock_at IS NULL
               AND receipt_webhook_sent_at IS NULL
+              AND receipt_webhook_lock_at = ?
             """,
-            (effective_lock_at, booking_id),
-        )
-        conn.commit()
-        return cur.rowcount > 0
+            (booking_id, lock_at),
+        ).fetchone()
+        return row is not None
     finally:
         conn.close()
 
 
-def release_receipt_webhook_lock(booking_id: int) -> bool:
-    """Release receipt webhook send lock only while still unsent."""
+def release_receipt_webhook_lock(booking_id: int, lock_at: str) -> bool:
+    """Release the ``lock_at`` claim only while it is still current and unsent."""
     conn = sqlite3.connect(DB_PATH)
     try:
         cur = conn.execute(
@@ -991,8 +1073,9 @@ def release_receipt_webhook_lock(booking_id: int) -> bool:
             SET receipt_webhook_lock_at = NULL
             WHERE id = ?
               AND receipt_webhook_sent_at IS NULL
+              AND receipt_webhook_lock_at = ?
             """,
-            (booking_id,),
+            (booking_id, lock_at),
         )
         conn.commit()
         return cur.rowcount > 0
@@ -1217,8 +1300,11 @@ def mark_test_sms_admin_sent(test_booking_id: int, *, sent_at: Optional[str] = N
             """,
             (effective_sent_at, test_booking_id),
         )
+        # Already marked: nothing changed, so skip the commit.
+        if cur.rowcount == 0:
+            return False
         conn.commit()
-        return cur.rowcount > 0
+        return True
     finally:
         conn.close()
 
@@ -1236,8 +1322,10 @@ def mark_test_sms_target_sent(test_booking_id: int, *, sent_at: Optional[str] =
             """,
             (effective_sent_at, test_booking_id),
         )
+        if cur.rowcount == 0:
+            return False
         conn.commit()
-        return cur.rowcount > 0
+        return True
     finally:
         conn.close()
 
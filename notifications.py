@@ -11,18 +11,121 @@ import hashlib
 import hmac
 import json
 import logging
+import queue
+import random
+import threading
 import time
 import urllib.request
-from typing import Any, Protocol
+from typing import Any, Callable, Protocol
 
 import db
 import requests
 from config import runtime
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
 COMPANY_NAME = "Dalsjöfors Hyrservice AB"
 ORGANIZATION_NUMBER = "559062-4556"
+_JSON_HEADERS = {"Content-Type": "application/json; charset=utf-8"}
+_SIGNATURE_HEADER = "X-Notify-Signature"
+# Upper bound for one receipt webhook send, attempts and backoff included.
+WEBHOOK_DEADLINE_SECONDS = 22
+_RECEIPT_REQUIRED_FIELDS = (
+    "booking_reference",
+    "trailer_type",
+    "start_dt",
+    "end_dt",
+    "price",
+    "customer_email_temp",
+    "receipt_requested_temp",
+)
+# Capped exponential backoff between webhook attempts; the actual delay is
+# drawn from [0, bound] so retries from concurrent bookings spread out.
+_RETRY_BACKOFF_BASE_SECONDS = 0.5
+_RETRY_BACKOFF_CAP_SECONDS = 4.0
+
+
+def _dumps_compact(value: Any) -> bytes:
+    """Serialize ``value`` to compact UTF-8 JSON, with orjson when installed.
+
+    The stdlib fallback uses the same separators, so the bytes (and their
+    signature) do not depend on which serializer is available.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _build_session() -> requests.Session:
+    """Return the session used for receipt webhooks.
+
+    Webhooks fire from request threads for every paid booking; a shared
+    session keeps the TLS connection to the endpoint alive between them.
+    Retries stay in ``send_receipt_webhook`` so backoff and the time budget
+    are applied in one place.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_SESSION = _build_session()
+
+# Receipt webhooks (with their retries and backoff) run here instead of on the
+# request thread that confirmed the payment.
+_WEBHOOK_QUEUE: queue.Queue[Callable[[], None]] = queue.Queue()
+_webhook_worker: threading.Thread | None = None
+_webhook_worker_lock = threading.Lock()
+
+
+def _drain_webhook_queue() -> None:
+    while True:
+        job = _WEBHOOK_QUEUE.get()
+        try:
+            job()
+        except Exception:
+            logger.exception("WEBHOOK_WORKER_FAILED")
+        finally:
+            _WEBHOOK_QUEUE.task_done()
+
+
+def submit_webhook(job: Callable[[], None]) -> None:
+    """Run ``job`` on the background webhook worker, starting it on first use."""
+    global _webhook_worker
+    with _webhook_worker_lock:
+        if _webhook_worker is None:
+            _webhook_worker = threading.Thread(target=_drain_webhook_queue, name="webhook-worker", daemon=True)
+            _webhook_worker.start()
+    _WEBHOOK_QUEUE.put(job)
+
+
+def _flush_webhook_queue() -> None:
+    """Block until every submitted webhook job has finished."""
+    _WEBHOOK_QUEUE.join()
+
+
+def drain_webhook_queue(timeout_seconds: float) -> bool:
+    """Wait up to ``timeout_seconds`` for queued webhook jobs; True if all finished.
+
+    Called on shutdown: the worker is a daemon thread, so jobs still queued
+    when the process exits are dropped.
+    """
+    deadline = time.monotonic() + timeout_seconds
+    with _WEBHOOK_QUEUE.all_tasks_done:
+        while _WEBHOOK_QUEUE.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _WEBHOOK_QUEUE.all_tasks_done.wait(remaining)
+    return True
 
 
 class _NoRedirectHandler(urllib.request.HTTPRedirectHandler):
@@ -39,6 +142,8 @@ class LogNotificationProvider:
     """Default provider that logs notification payloads."""
 
     def send(self, event: str, payload: dict[str, Any]) -> None:
+        if not logger.isEnabledFor(logging.INFO):
+            return
         logger.info("booking_notification event=%s payload=%s", event, json.dumps(payload, ensure_ascii=False))
 
 
@@ -56,8 +161,7 @@ class WebhookNotificationProvider:
 
         headers = {"Content-Type": "application/json"}
         if self.secret:
-            digest = hmac.new(self.secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
-            headers["X-Notify-Signature"] = f"sha256={digest}"
+            headers[_SIGNATURE_HEADER] = f"sha256={_sign_body(self.secret, body)}"
 
         request = urllib.request.Request(self.url, data=body, headers=headers, method="POST")
         with urllib.request.urlopen(request, timeout=self.timeout_seconds):
@@ -128,40 +232,73 @@ def _short_error(text: str, *, limit: int = 120) -> str:
     return value[:limit] + "..."
 
 
-def _post_json_no_redirect(url: str, payload: dict[str, Any], *, timeout_seconds: int) -> tuple[int, str, str | None]:
+def _sign_body(secret: str, body: bytes) -> str:
+    return hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def _post_json_no_redirect(
+    url: str, body: bytes, *, timeout_seconds: float, signature: str | None = None
+) -> tuple[int, str, Any]:
+    headers = _JSON_HEADERS
+    params = None
+    if signature:
+        headers = {**_JSON_HEADERS, _SIGNATURE_HEADER: f"sha256={signature}"}
+        # Apps Script web apps cannot read request headers, so the receiver
+        # checks the same digest from the query string.
+        params = {"signature": signature}
     try:
-        response = requests.post(
+        response = _SESSION.post(
             url,
-            json=payload,
+            data=body,
+            headers=headers,
+            params=params,
             timeout=timeout_seconds,
             allow_redirects=False,
         )
     except requests.RequestException:
         raise
-    return int(response.status_code or 0), response.text, response.headers.get("Location")
+    return int(response.status_code or 0), response.text, response.headers
 
 
 def _response_declares_ok(response_body: str) -> bool:
     body_text = (response_body or "").strip()
     if not body_text:
         return False
+    if "ok" in body_text.lower():
+        return True
+    # Only a JSON object with "success": true can still qualify; skip the
+    # parse for everything else.
+    if not body_text.startswith("{") or "success" not in body_text:
+        return False
     try:
         parsed = json.loads(body_text)
     except json.JSONDecodeError:
-        return "ok" in body_text.lower()
-    if isinstance(parsed, dict):
-        if parsed.get("ok") is True:
-            return True
-        if parsed.get("success") is True:
-            return True
-    return "ok" in body_text.lower()
+        return False
+    return isinstance(parsed, dict) and parsed.get("success") is True
+
+
+def _retry_delay(attempt: int) -> float:
+    """Return the full-jitter backoff before retrying after ``attempt``."""
+    bound = min(_RETRY_BACKOFF_CAP_SECONDS, _RETRY_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+    return random.uniform(0, bound)
+
 
+def send_receipt_webhook(
+    booking: dict[str, Any],
+    *,
+    on_failure: Callable[[dict[str, Any], int, str], None] | None = None,
+) -> bool:
+    """POST the receipt for a PAID booking; return True once it is accepted.
 
-def send_receipt_webhook(booking: dict[str, Any]) -> bool:
+    With a webhook secret configured, the body is signed with HMAC-SHA256
+    rather than carrying the secret. ``on_failure`` is called with the
+    payload, the last HTTP status (0 without a response) and an error
+    excerpt when delivery fails for good, after retries.
+    """
     booking_id_raw = booking.get("id")
     booking_id = int(booking_id_raw) if isinstance(booking_id_raw, int) or (isinstance(booking_id_raw, str) and booking_id_raw.isdigit()) else None
-    required_fields = ("booking_reference", "trailer_type", "start_dt", "end_dt", "price", "customer_email_temp", "receipt_requested_temp")
-    if booking_id is not None and any(booking.get(field) in (None, "") for field in required_fields):
+    # Callers normally pass a freshly loaded row; only refetch partial dicts.
+    if booking_id is not None and any(booking.get(field) in (None, "") for field in _RECEIPT_REQUIRED_FIELDS):
         booking = db.get_booking_by_id(booking_id) or booking
 
     customer_email = (booking.get("customer_email_temp") or "").strip()
@@ -175,7 +312,6 @@ def send_receipt_webhook(booking: dict[str, Any]) -> bool:
         return False
 
     payload = {
-        "secret": runtime.webhook_secret(),
         "receiptRequested": True,
         "customerEmail": customer_email,
         "event": "booking.confirmed",
@@ -189,31 +325,48 @@ def send_receipt_webhook(booking: dict[str, Any]) -> bool:
         "price": booking.get("price"),
         "swishStatus": "PAID",
     }
-    logger.info(
-        "WEBHOOK_SEND event=booking.confirmed bookingReference=%s customerEmail=%s",
-        booking.get("booking_reference"),
-        mask_email(customer_email),
-    )
+    # Serialize once; retries resend the same bytes.
+    body = _dumps_compact(payload)
+    webhook_secret = runtime.webhook_secret()
+    signature = _sign_body(webhook_secret, body) if webhook_secret else None
+
+    def _report_failure(status_code: int, error: str) -> None:
+        if on_failure is not None:
+            on_failure(payload, status_code, error)
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "WEBHOOK_SEND event=booking.confirmed bookingReference=%s customerEmail=%s",
+            booking.get("booking_reference"),
+            mask_email(customer_email),
+        )
     max_attempts = 3
-    retry_backoff_seconds = (0.5, 1.0)
+    deadline = time.monotonic() + WEBHOOK_DEADLINE_SECONDS
     for attempt in range(1, max_attempts + 1):
         try:
-            status_code, response_body, redirect_location = _post_json_no_redirect(webhook_url, payload, timeout_seconds=10)
+            status_code, response_body, response_headers = _post_json_no_redirect(
+                webhook_url,
+                body,
+                timeout_seconds=min(10, max(deadline - time.monotonic(), 1)),
+                signature=signature,
+            )
         except requests.Timeout as exc:
-            if attempt < max_attempts:
+            delay = _retry_delay(attempt)
+            if attempt < max_attempts and time.monotonic() + delay < deadline:
                 logger.warning(
                     "WEBHOOK_RETRY reason=timeout attempt=%s bookingReference=%s error=%s",
                     attempt,
                     booking.get("booking_reference"),
                     _short_error(str(exc)),
                 )
-                time.sleep(retry_backoff_seconds[attempt - 1])
+                time.sleep(delay)
                 continue
             logger.warning(
                 "WEBHOOK_FAIL status=0 bookingReference=%s error=%s",
                 booking.get("booking_reference"),
                 _short_error(str(exc)),
             )
+            _report_failure(0, _short_error(str(exc)))
             return False
         except Exception as exc:
             logger.warning(
@@ -221,6 +374,7 @@ def send_receipt_webhook(booking: dict[str, Any]) -> bool:
                 booking.get("booking_reference"),
                 _short_error(str(exc)),
             )
+            _report_failure(0, _short_error(str(exc)))
             return False
 
         if status_code in {302, 303}:
@@ -238,22 +392,32 @@ def send_receipt_webhook(booking: dict[str, Any]) -> bool:
                 logger.info("WEBHOOK_OK status=%s bookingReference=%s", status_code, booking.get("booking_reference"))
             return True
 
-        if 500 <= status_code < 600 and attempt < max_attempts:
+        # A Retry-After asks for a later retry than our budget allows; leave
+        # it to the next notification pass instead of hammering the server.
+        delay = _retry_delay(attempt)
+        if (
+            500 <= status_code < 600
+            and attempt < max_attempts
+            and not response_headers.get("Retry-After")
+            and time.monotonic() + delay < deadline
+        ):
             logger.warning(
                 "WEBHOOK_RETRY reason=server_error status=%s attempt=%s bookingReference=%s",
                 status_code,
                 attempt,
                 booking.get("booking_reference"),
             )
-            time.sleep(retry_backoff_seconds[attempt - 1])
+            time.sleep(delay)
             continue
 
+        error = _short_error(response_body if response_body else (response_headers.get("Location") or ""))
         logger.warning(
             "WEBHOOK_FAIL status=%s body=%s bookingReference=%s",
             status_code,
-            _short_error(response_body if response_body else (redirect_location or "")),
+            error,
             booking.get("booking_reference"),
         )
+        _report_failure(status_code, error)
         return False
 
     return False
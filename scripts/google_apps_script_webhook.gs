@@ -6,7 +6,8 @@
  * - Issue report emails (type=issue_report) with clear Swedish formatting
  *
  * Script properties:
- * - WEBHOOK_SECRET or NOTIFY_WEBHOOK_SECRET (optional, but recommended)
+ * - WEBHOOK_SECRET or NOTIFY_WEBHOOK_SECRET (optional, but recommended);
+ *   receipts are verified by HMAC signature, issue reports by body.secret
  */
 
 function doPost(e) {
@@ -22,7 +23,7 @@ function doPost(e) {
       ""
   );
   var providedSecret = _trim(body.secret || "");
-  if (expectedSecret && providedSecret !== expectedSecret) {
+  if (expectedSecret && providedSecret !== expectedSecret && !_signatureMatches(e, expectedSecret)) {
     return _jsonResponse({ ok: false, error: "unauthorized" });
   }
 
@@ -226,6 +227,27 @@ function _parsePayload(e) {
   }
 }
 
+// Receipts are signed instead of carrying the secret: ?signature= holds the
+// hex HMAC-SHA256 of the raw body (also sent as X-Notify-Signature, which
+// Apps Script cannot read).
+function _signatureMatches(e, secret) {
+  var provided = _trim(e && e.parameter ? e.parameter.signature : "").toLowerCase();
+  var contents = e && e.postData ? e.postData.contents : "";
+  if (!provided || !contents) return false;
+  var digest = Utilities.computeHmacSha256Signature(contents, secret, Utilities.Charset.UTF_8);
+  var expected = "";
+  for (var i = 0; i < digest.length; i++) {
+    var octet = (digest[i] + 256) % 256;
+    expected += (octet < 16 ? "0" : "") + octet.toString(16);
+  }
+  if (provided.length !== expected.length) return false;
+  var diff = 0;
+  for (var j = 0; j < expected.length; j++) {
+    diff |= provided.charCodeAt(j) ^ expected.charCodeAt(j);
+  }
+  return diff === 0;
+}
+
 function _jsonResponse(obj) {
   return ContentService.createTextOutput(JSON.stringify(obj)).setMimeType(ContentService.MimeType.JSON);
 }
@@ -5,12 +5,17 @@ from __future__ import annotations
 import base64
 import logging
 import os
+import re
 import urllib.parse
 import urllib.request
+from functools import lru_cache
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 _twilio_disabled_logged = False
+_NON_PHONE_CHARS_RE = re.compile(r"[^0-9+]")
+# +46 / 0046 with an optional trunk zero, or national 07 format.
+_SWEDISH_MOBILE_RE = re.compile(r"(?:(?:\+|00)460?|0)(7[0-9]{8})")
 
 
 def normalize_swedish_mobile(raw_value: Optional[str]) -> Optional[str]:
@@ -18,27 +23,40 @@ def normalize_swedish_mobile(raw_value: Optional[str]) -> Optional[str]:
     value = (raw_value or "").strip()
     if not value:
         return None
-    compact = "".join(ch for ch in value if ch.isdigit() or ch == "+")
-    if compact.startswith("0046"):
-        compact = f"+46{compact[4:]}"
-    if compact.startswith("+46"):
-        national = compact[3:]
-        if national.startswith("0"):
-            national = national[1:]
-        if len(national) != 9 or not national.startswith("7") or not national.isdigit():
-            return None
-        return f"+46{national}"
-    if compact.startswith("07") and len(compact) == 10 and compact.isdigit():
-        return f"+46{compact[1:]}"
-    return None
+    compact = _NON_PHONE_CHARS_RE.sub("", value)
+    match = _SWEDISH_MOBILE_RE.fullmatch(compact)
+    if not match:
+        return None
+    return f"+46{match.group(1)}"
 
 
 def _env(name: str) -> str:
     return (os.environ.get(name) or "").strip()
 
 
+def _twilio_credentials() -> Optional[tuple[str, str, str]]:
+    """Return (account SID, auth token, from number), or None if any is unset."""
+    account_sid = _env("TWILIO_ACCOUNT_SID")
+    auth_token = _env("TWILIO_AUTH_TOKEN")
+    from_number = _env("TWILIO_FROM_NUMBER")
+    if not (account_sid and auth_token and from_number):
+        return None
+    return account_sid, auth_token, from_number
+
+
 def _twilio_env_configured() -> bool:
-    return bool(_env("TWILIO_ACCOUNT_SID") and _env("TWILIO_AUTH_TOKEN") and _env("TWILIO_FROM_NUMBER"))
+    return _twilio_credentials() is not None
+
+
+@lru_cache(maxsize=4)
+def _twilio_endpoint_and_auth(account_sid: str, auth_token: str) -> tuple[str, str]:
+    """Return the Messages endpoint and Authorization header for an account.
+
+    Keyed on the credential values, so changed env vars build a new pair.
+    """
+    endpoint = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/Messages.json"
+    basic_auth = base64.b64encode(f"{account_sid}:{auth_token}".encode("utf-8")).decode("ascii")
+    return endpoint, f"Basic {basic_auth}"
 
 
 def _log_twilio_disabled_once() -> None:
@@ -53,33 +71,26 @@ def _log_twilio_disabled_once() -> None:
 
 def send_sms(to_e164: str, message: str) -> bool:
     """Send SMS using Twilio env config. Returns False on any failure."""
-    if not _twilio_env_configured():
+    credentials = _twilio_credentials()
+    if credentials is None:
         _log_twilio_disabled_once()
         return False
-    account_sid = _env("TWILIO_ACCOUNT_SID")
-    auth_token = _env("TWILIO_AUTH_TOKEN")
-    from_number = _env("TWILIO_FROM_NUMBER")
+    account_sid, auth_token, from_number = credentials
 
     target = normalize_swedish_mobile(to_e164) if not to_e164.startswith("+") else to_e164
     if not target:
         logger.warning("SMS not sent: invalid target phone number.")
         return False
 
-    endpoint = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/Messages.json"
-    payload = urllib.parse.urlencode(
-        {
-            "To": target,
-            "From": from_number,
-            "Body": message[:1600],
-        }
-    ).encode("utf-8")
-    basic_auth = base64.b64encode(f"{account_sid}:{auth_token}".encode("utf-8")).decode("ascii")
+    endpoint, authorization = _twilio_endpoint_and_auth(account_sid, auth_token)
+    quote = urllib.parse.quote_plus
+    payload = f"To={quote(target)}&From={quote(from_number)}&Body={quote(message[:1600])}".encode("ascii")
     request = urllib.request.Request(
         endpoint,
         data=payload,
         method="POST",
         headers={
-            "Authorization": f"Basic {basic_auth}",
+            "Authorization": authorization,
             "Content-Type": "application/x-www-form-urlencoded",
         },
     )
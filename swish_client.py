@@ -1,10 +1,18 @@
 from __future__ import annotations
 
+import json
+import logging
+import os
+import ssl
+import threading
 import uuid
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Any, Dict, Optional
 
-import requests
+import urllib3
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -18,19 +26,102 @@ class SwishConfig:
     mock: bool = True
 
 
+@dataclass(frozen=True, slots=True)
+class SwishPayment:
+    """Identifiers for a created payment request.
+
+    The instruction UUID doubles as the payee payment reference / request id.
+    """
+
+    instruction_uuid: str
+    token: str
+    swish_app_url: str
+
+
+_QR_SVG_TEMPLATE = (
+    "<svg xmlns='http://www.w3.org/2000/svg' width='200' height='200'>"
+    "<text x='10' y='100'>token:{}</text></svg>"
+)
+
+
+def _build_ssl_context(cert_path: str, key_path: str, ca_path: Optional[str]) -> ssl.SSLContext:
+    context = ssl.create_default_context(cafile=ca_path) if ca_path else ssl.create_default_context()
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+def _file_mtime_ns(path: Optional[str]) -> Optional[int]:
+    if not path:
+        return None
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _mtls_pool(cert_path: str, key_path: str, ca_path: Optional[str]) -> urllib3.PoolManager:
+    """Return a connection pool for one mTLS identity.
+
+    Clients are created per HTTP request, so the pool lives at module level
+    to keep TLS connections alive between Swish calls. Certificate files are
+    parsed when the pool is built; the pool is keyed on their modification
+    times, so certificates rotated in place at the same paths are picked up
+    on the next request without a restart.
+    """
+    mtimes = (_file_mtime_ns(cert_path), _file_mtime_ns(key_path), _file_mtime_ns(ca_path))
+    return _mtls_pool_for_files(cert_path, key_path, ca_path, mtimes)
+
+
+@lru_cache(maxsize=8)
+def _mtls_pool_for_files(
+    cert_path: str, key_path: str, ca_path: Optional[str], _mtimes: tuple[Optional[int], ...]
+) -> urllib3.PoolManager:
+    # Retries are left to callers: a blind resend of a PUT would reach Swish twice.
+    return urllib3.PoolManager(
+        num_pools=4,
+        maxsize=16,
+        block=False,
+        retries=False,
+        ssl_context=_build_ssl_context(cert_path, key_path, ca_path),
+    )
+
+
+def _response_text(response: urllib3.BaseHTTPResponse) -> str:
+    return response.data.decode("utf-8", errors="replace")
+
+
+def warm_up(cfg: SwishConfig) -> Optional[threading.Thread]:
+    """Open the first pooled mTLS connection to Swish in the background.
+
+    Called once at startup so the first payment request does not pay the
+    TLS handshake. Certificates are loaded on the thread too, so a bad cert
+    is logged here and only fails the payment requests, not startup.
+    Returns the started thread, or None in mock mode.
+    """
+    if cfg.mock or not cfg.cert_path or not cfg.key_path:
+        return None
+
+    def _run() -> None:
+        try:
+            pool = _mtls_pool(cfg.cert_path, cfg.key_path, cfg.ca_path)
+            pool.request("HEAD", cfg.base_url, timeout=10)
+        except Exception as exc:
+            logger.warning("SWISH_WARMUP_FAILED error=%s", str(exc)[:200])
+
+    thread = threading.Thread(target=_run, name="swish-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
 class SwishClient:
     def __init__(self, cfg: SwishConfig):
         self.cfg = cfg
-
-    def _requests_kwargs(self) -> Dict[str, Any]:
-        if not self.cfg.cert_path or not self.cfg.key_path:
-            raise RuntimeError("Swish mTLS requires cert and key paths")
-        kwargs: Dict[str, Any] = {
-            "timeout": 10,
-            "cert": (self.cfg.cert_path, self.cfg.key_path),
-            "verify": self.cfg.ca_path or True,
-        }
-        return kwargs
+        self._payment_requests_url = f"{cfg.base_url.rstrip('/')}/api/v2/paymentrequests/"
+        self._http: Optional[urllib3.PoolManager] = None
+        if not cfg.mock:
+            if not cfg.cert_path or not cfg.key_path:
+                raise RuntimeError("Swish mTLS requires cert and key paths")
+            self._http = _mtls_pool(cfg.cert_path, cfg.key_path, cfg.ca_path)
 
     def create_payment_request(
         self,
@@ -38,64 +129,59 @@ class SwishClient:
         message: str,
         callback_url_placeholder: Optional[str] = None,
         payer_alias: Optional[str] = None,
-    ) -> Dict[str, Any]:
+    ) -> SwishPayment:
         """Create Swish payment request.
 
         In mock mode, returns synthetic identifiers used by local booking flows.
         In non-mock mode, performs a Commerce API call over mTLS.
         """
-        instruction_uuid = str(uuid.uuid4())
-        token = str(uuid.uuid4()).replace("-", "")
-        request_id = instruction_uuid
+        raw = os.urandom(32)
+        instruction_uuid = str(uuid.UUID(bytes=raw[:16], version=4))
+        token = raw[16:].hex()
 
         callback_url = callback_url_placeholder or self.cfg.callback_url
         swish_app_url = f"swish://paymentrequest?token={token}&callbackurl={callback_url}"
 
         if not self.cfg.mock:
-            endpoint = f"{self.cfg.base_url.rstrip('/')}/api/v2/paymentrequests/{instruction_uuid}"
+            endpoint = self._payment_requests_url + instruction_uuid
             payload = {
-                "payeePaymentReference": request_id,
+                "payeePaymentReference": instruction_uuid,
                 "callbackUrl": callback_url,
                 "payeeAlias": self.cfg.merchant_alias,
                 "amount": f"{int(amount_sek)}",
                 "currency": "SEK",
                 "message": message[:50],
             }
-            response = requests.put(
+            body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            response = self._http.request(
+                "PUT",
                 endpoint,
-                json=payload,
+                body=body,
                 headers={"Content-Type": "application/json"},
-                **self._requests_kwargs(),
+                timeout=10,
             )
-            if int(response.status_code or 0) >= 300:
+            if response.status >= 300:
                 raise RuntimeError(
-                    f"Swish create payment failed: {response.status_code} {response.text[:200]}"
+                    f"Swish create payment failed: {response.status} {_response_text(response)[:200]}"
                 )
 
-        return {
-            "instruction_uuid": instruction_uuid,
-            "token": token,
-            "request_id": request_id,
-            "swish_app_url": swish_app_url,
-        }
+        return SwishPayment(instruction_uuid, token, swish_app_url)
 
     def get_payment_request(self, request_id: str) -> Dict[str, Any]:
         if not self.cfg.mock:
-            endpoint = f"{self.cfg.base_url.rstrip('/')}/api/v2/paymentrequests/{request_id}"
-            response = requests.get(
+            endpoint = self._payment_requests_url + request_id
+            response = self._http.request(
+                "GET",
                 endpoint,
                 headers={"Accept": "application/json"},
-                **self._requests_kwargs(),
+                timeout=10,
             )
-            if int(response.status_code or 0) >= 300:
-                raise RuntimeError(f"Swish get payment failed: {response.status_code} {response.text[:200]}")
-            payload = response.json() if response.text else {}
+            if response.status >= 300:
+                raise RuntimeError(f"Swish get payment failed: {response.status} {_response_text(response)[:200]}")
+            payload = json.loads(response.data) if response.data else {}
             status = str(payload.get("status") or "PENDING").upper()
             return {"id": request_id, "status": status}
         return {"id": request_id, "status": "PENDING"}
 
     def get_qr_svg(self, token: str) -> str:
-        return (
-            "<svg xmlns='http://www.w3.org/2000/svg' width='200' height='200'>"
-            f"<text x='10' y='100'>token:{token}</text></svg>"
-        )
+        return _QR_SVG_TEMPLATE.format(token)
@@ -0,0 +1,57 @@
+"""Common fixture for test classes that talk to the shared app server."""
+
+import os
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import db
+from _shared_server import get_server
+from _support import init_test_db, tmp_dir
+
+
+class ServerTestBase(unittest.TestCase):
+    """Give each test class its own database and environment on the shared server.
+
+    Set ``ADMIN_TOKEN = True`` to export ``cls._admin_token`` as
+    ``ADMIN_TOKEN``; further variables go in ``ENV``. All of them are restored
+    in ``tearDownClass``. Subclasses that need more setup extend
+    ``setUpClass``/``tearDownClass`` and call ``super()``.
+    """
+
+    ADMIN_TOKEN = False
+    ENV: dict[str, str] = {}
+
+    _admin_token = "test-admin-token"
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls._setup_server()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls._teardown_server()
+        super().tearDownClass()
+
+    @classmethod
+    def _setup_server(cls) -> None:
+        env = dict(cls.ENV)
+        if cls.ADMIN_TOKEN:
+            env["ADMIN_TOKEN"] = cls._admin_token
+        cls._env_patcher = mock.patch.dict(os.environ, env)
+        cls._env_patcher.start()
+
+        cls._tmpdir = tmp_dir()
+        cls._original_db_path = db.DB_PATH
+        db.DB_PATH = Path(cls._tmpdir.name) / "test_database.db"
+        init_test_db()
+
+        cls._server = get_server()
+        cls._base_url = f"http://127.0.0.1:{cls._server.server_port}"
+
+    @classmethod
+    def _teardown_server(cls) -> None:
+        cls._env_patcher.stop()
+        db.DB_PATH = cls._original_db_path
+        cls._tmpdir.cleanup()
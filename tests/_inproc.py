@@ -0,0 +1,45 @@
+"""Call ``app.Handler`` in-process, without a socket or the shared server.
+
+Only ``test_callback_requires_secret_in_non_mock_mode`` in
+test_runtime_and_callback_security.py uses it; the other API tests go
+through the shared server.
+"""
+
+import io
+from email.message import Message
+from http.client import parse_headers
+
+import app
+
+
+class _Handler(app.Handler):
+    def __init__(self, raw_request: bytes) -> None:
+        # BaseRequestHandler.__init__ expects a socket and serves at once;
+        # set up the attributes it would have and let call() drive it.
+        self.request = None
+        self.connection = None
+        self.client_address = ("127.0.0.1", 0)
+        self.server = None
+        self.rfile = io.BytesIO(raw_request)
+        self.wfile = io.BytesIO()
+
+
+def call(
+    method: str,
+    path: str,
+    body: bytes | None = None,
+    headers: dict[str, str] | None = None,
+) -> tuple[int, Message, bytes]:
+    """Serve one request and return ``(status, headers, body)``."""
+    lines = [f"{method} {path} HTTP/1.0", "Host: 127.0.0.1"]
+    lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    if body is not None:
+        lines.append(f"Content-Length: {len(body)}")
+    raw_request = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b"")
+
+    handler = _Handler(raw_request)
+    handler.handle_one_request()
+
+    response = io.BytesIO(handler.wfile.getvalue())
+    status = int(response.readline().split()[1])
+    return status, parse_headers(response), response.read()
@@ -0,0 +1,71 @@
+"""One app server shared by every HTTP test class in the run.
+
+The handler reads ``db.DB_PATH`` and the environment on each request, so test
+classes keep their own temporary database and settings while reusing a single
+listening socket and serve thread.
+"""
+
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+from typing import Any
+
+import app
+from _support import SERVE_POLL_INTERVAL
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that handles requests on a bounded worker pool.
+
+    ThreadingHTTPServer starts one thread per connection; a fixed pool keeps
+    bursts from fanning out into dozens of threads contending on SQLite.
+    Production ``app.run()`` serves serially because handlers keep unlocked
+    module state such as ``REPORT_RATE_LIMIT_BY_IP``; tests use the pool so
+    the slot-locking race test can send concurrent requests.
+    """
+
+    def __init__(self, server_address: tuple[str, int], handler_class: type, *, max_workers: int | None = None):
+        super().__init__(server_address, handler_class)
+        workers = max_workers or min(8, (os.cpu_count() or 1) * 2)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http-worker")
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        self._executor.submit(self._process_request_in_worker, request, client_address)
+
+    def _process_request_in_worker(self, request: Any, client_address: Any) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._executor.shutdown(wait=True)
+
+
+_server: PooledHTTPServer | None = None
+_lock = threading.Lock()
+
+
+def _shutdown(server: PooledHTTPServer, thread: threading.Thread) -> None:
+    server.shutdown()
+    server.server_close()
+    thread.join(timeout=2)
+
+
+def get_server() -> PooledHTTPServer:
+    global _server
+    with _lock:
+        if _server is None:
+            server = PooledHTTPServer(("127.0.0.1", 0), app.Handler)
+            thread = threading.Thread(
+                target=server.serve_forever, kwargs={"poll_interval": SERVE_POLL_INTERVAL}, daemon=True
+            )
+            thread.start()
+            atexit.register(_shutdown, server, thread)
+            _server = server
+        return _server
@@ -0,0 +1,60 @@
+"""Small fixtures shared by the test modules."""
+
+import atexit
+import os
+import shutil
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import urllib3
+
+import db
+
+# One connection pool for the JSON helpers of every test module. Retries are
+# off so a failing request surfaces as-is.
+HTTP = urllib3.PoolManager(num_pools=1, maxsize=8, retries=False)
+
+# serve_forever() checks for shutdown at this interval; with the 0.5 s default,
+# every server.shutdown() in a test waits up to half a second.
+SERVE_POLL_INTERVAL = 0.05
+
+# tmpfs on Linux; keeps the per-class SQLite files and their commits off disk.
+_SHM_DIR = "/dev/shm"
+
+
+def tmp_dir() -> TemporaryDirectory:
+    """Return a temporary directory for a test database, in RAM when possible."""
+    if os.path.isdir(_SHM_DIR) and os.access(_SHM_DIR, os.W_OK):
+        return TemporaryDirectory(dir=_SHM_DIR)
+    return TemporaryDirectory()
+
+
+_template_lock = threading.Lock()
+_template_path: Path | None = None
+
+
+def _template_db() -> Path:
+    global _template_path
+    with _template_lock:
+        if _template_path is None:
+            template_dir = tmp_dir()
+            atexit.register(template_dir.cleanup)
+            path = Path(template_dir.name) / "template.db"
+            original_db_path = db.DB_PATH
+            db.DB_PATH = path
+            try:
+                db.init_db()
+            finally:
+                db.DB_PATH = original_db_path
+            _template_path = path
+        return _template_path
+
+
+def init_test_db() -> None:
+    """Create the schema at ``db.DB_PATH`` by copying a per-process template.
+
+    ``db.init_db()`` runs once per process; every later test database is a
+    plain file copy instead of a fresh round of DDL.
+    """
+    shutil.copyfile(_template_db(), db.DB_PATH)
@@ -1,60 +1,23 @@
 import http.client
-import json
-import os
-import threading
 import unittest
-from http.server import ThreadingHTTPServer
-from pathlib import Path
-from tempfile import TemporaryDirectory
 from urllib.parse import urlencode
 
-import app
-import db
+from _base import ServerTestBase
+from _json_compat import loads
 
 
-class AdminAuthSessionTest(unittest.TestCase):
+class AdminAuthSessionTest(ServerTestBase):
+    ADMIN_TOKEN = True
+    _admin_password = "test-admin-password"
+    _session_secret = "test-admin-session-secret"
+    ENV = {"ADMIN_PASSWORD": _admin_password, "ADMIN_SESSION_SECRET": _session_secret}
+
     @classmethod
     def setUpClass(cls) -> None:
-        cls._tmpdir = TemporaryDirectory()
-        cls._original_db_path = db.DB_PATH
-        cls._original_admin_token = os.environ.get("ADMIN_TOKEN")
-        cls._original_admin_password = os.environ.get("ADMIN_PASSWORD")
-        cls._original_session_secret = os.environ.get("ADMIN_SESSION_SECRET")
-        cls._admin_token = "test-admin-token"
-        cls._admin_password = "test-admin-password"
-        cls._session_secret = "test-admin-session-secret"
-        os.environ["ADMIN_TOKEN"] = cls._admin_token
-        os.environ["ADMIN_PASSWORD"] = cls._admin_password
-        os.environ["ADMIN_SESSION_SECRET"] = cls._session_secret
-        db.DB_PATH = Path(cls._tmpdir.name) / "test_database.db"
-        db.init_db()
-
-        cls._server = ThreadingHTTPServer(("127.0.0.1", 0), app.Handler)
-        cls._thread = threading.Thread(target=cls._server.serve_forever, daemon=True)
-        cls._thread.start()
+        super().setUpClass()
         cls._host = "127.0.0.1"
         cls._port = cls._server.server_port
 
-    @classmethod
-    def tearDownClass(cls) -> None:
-        cls._server.shutdown()
-        cls._server.server_close()
-        cls._thread.join(timeout=2)
-        if cls._original_admin_token is None:
-            os.environ.pop("ADMIN_TOKEN", None)
-        else:
-            os.environ["ADMIN_TOKEN"] = cls._original_admin_token
-        if cls._original_admin_password is None:
-            os.environ.pop("ADMIN_PASSWORD", None)
-        else:
-            os.environ["ADMIN_PASSWORD"] = cls._original_admin_password
-        if cls._original_session_secret is None:
-            os.environ.pop("ADMIN_SESSION_SECRET", None)
-        else:
-            os.environ["ADMIN_SESSION_SECRET"] = cls._original_session_secret
-        db.DB_PATH = cls._original_db_path
-        cls._tmpdir.cleanup()
-
     def _request(
         self, method: str, path: str, *, body: str | None = None, headers: dict | None = None
     ) -> tuple[int, http.client.HTTPMessage, str]:
@@ -119,7 +82,7 @@ class AdminAuthSessionTest(unittest.TestCase):
     def test_api_admin_unauthorized_without_auth(self) -> None:
         status, _, body = self._request("GET", "/api/admin/bookings")
         self.assertEqual(status, 401)
-        payload = json.loads(body)
+        payload = loads(body)
         self.assertEqual(payload.get("errorInfo", {}).get("code"), "unauthorized")
 
     def test_api_admin_authorized_with_header(self) -> None:
@@ -127,7 +90,7 @@ class AdminAuthSessionTest(unittest.TestCase):
             "GET", "/api/admin/bookings", headers={"Authorization": f"Bearer {self._admin_token}"}
         )
         self.assertEqual(status, 200)
-        payload = json.loads(body)
+        payload = loads(body)
         self.assertIn("bookings", payload)
 
     def test_tampered_cookie_rejected(self) -> None:
@@ -1,103 +1,66 @@
-import json
-import os
 import sqlite3
-import threading
 import unittest
 from datetime import datetime, timedelta
-from http.server import ThreadingHTTPServer
-from pathlib import Path
-from tempfile import TemporaryDirectory
-from urllib.error import HTTPError
 from urllib.parse import urlencode
-from urllib.request import Request, urlopen
 
-import app
 import db
+from _base import ServerTestBase
+from _json_compat import dumps, loads
+from _support import HTTP
 
 
-class AdminBlocksAndPendingExpirationTest(unittest.TestCase):
+class AdminBlocksAndPendingExpirationTest(ServerTestBase):
+    ADMIN_TOKEN = True
+
+    # Hold bodies posted repeatedly by the capacity tests, encoded once.
+    _HOLD_GALLER_MAY_9 = dumps(
+        {"trailerType": "GALLER", "rentalType": "TWO_HOURS", "date": "2026-05-09", "startTime": "10:00"}
+    )
+    _HOLD_KAP_MAY_10 = dumps(
+        {"trailerType": "KAP", "rentalType": "TWO_HOURS", "date": "2026-05-10", "startTime": "10:00"}
+    )
+
     @classmethod
     def setUpClass(cls) -> None:
-        cls._tmpdir = TemporaryDirectory()
-        cls._original_db_path = db.DB_PATH
-        cls._original_admin_token = os.environ.get("ADMIN_TOKEN")
-        cls._admin_token = "test-admin-token"
-        os.environ["ADMIN_TOKEN"] = cls._admin_token
-        db.DB_PATH = Path(cls._tmpdir.name) / "test_database.db"
-        db.init_db()
-
-        cls._server = ThreadingHTTPServer(("127.0.0.1", 0), app.Handler)
-        cls._thread = threading.Thread(target=cls._server.serve_forever, daemon=True)
-        cls._thread.start()
-        cls._base_url = f"http://127.0.0.1:{cls._server.server_port}"
+        super().setUpClass()
+        cls._conn = sqlite3.connect(db.DB_PATH)
 
     @classmethod
     def tearDownClass(cls) -> None:
-        cls._server.shutdown()
-        cls._server.server_close()
-        cls._thread.join(timeout=2)
-        if cls._original_admin_token is None:
-            os.environ.pop("ADMIN_TOKEN", None)
-        else:
-            os.environ["ADMIN_TOKEN"] = cls._original_admin_token
-        db.DB_PATH = cls._original_db_path
-        cls._tmpdir.cleanup()
-
-    def _post_json(self, path: str, payload: dict, admin_token: str | None = "use-default") -> tuple[int, dict]:
-        headers = {"Content-Type": "application/json"}
-        if path.startswith("/api/admin/"):
-            if admin_token == "use-default":
-                headers["Authorization"] = f"Bearer {self._admin_token}"
-            elif admin_token:
-                headers["Authorization"] = f"Bearer {admin_token}"
-        request = Request(
-            f"{self._base_url}{path}",
-            data=json.dumps(payload).encode("utf-8"),
-            headers=headers,
-            method="POST",
-        )
-        try:
-            with urlopen(request) as response:
-                return response.status, json.loads(response.read().decode("utf-8"))
-        except HTTPError as err:
-            body = err.read().decode("utf-8")
-            return err.code, json.loads(body)
-
-    def _get_json(self, path: str, params: dict | None = None, admin_token: str | None = "use-default") -> tuple[int, dict]:
-        url = f"{self._base_url}{path}"
+        cls._conn.close()
+        super().tearDownClass()
+
+    def _request_json(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: dict | None = None,
+        payload: dict | bytes | None = None,
+        admin_token: str | None = "use-default",
+    ) -> tuple[int, dict]:
         if params:
-            url = f"{url}?{urlencode(params)}"
+            path = f"{path}?{urlencode(params)}"
         headers = {}
+        if payload is not None:
+            headers["Content-Type"] = "application/json"
         if path.startswith("/api/admin/"):
             if admin_token == "use-default":
                 headers["Authorization"] = f"Bearer {self._admin_token}"
             elif admin_token:
                 headers["Authorization"] = f"Bearer {admin_token}"
-        request = Request(url, headers=headers)
-        try:
-            with urlopen(request) as response:
-                return response.status, json.loads(response.read().decode("utf-8"))
-        except HTTPError as err:
-            body = err.read().decode("utf-8")
-            return err.code, json.loads(body)
+        body = payload if payload is None or isinstance(payload, bytes) else dumps(payload)
+        response = HTTP.request(method, f"{self._base_url}{path}", body=body, headers=headers)
+        return response.status, loads(response.data)
+
+    def _post_json(self, path: str, payload: dict | bytes, admin_token: str | None = "use-default") -> tuple[int, dict]:
+        return self._request_json("POST", path, payload=payload, admin_token=admin_token)
+
+    def _get_json(self, path: str, params: dict | None = None, admin_token: str | None = "use-default") -> tuple[int, dict]:
+        return self._request_json("GET", path, params=params, admin_token=admin_token)
 
     def _delete_json(self, path: str, params: dict | None = None, admin_token: str | None = "use-default") -> tuple[int, dict]:
-        url = f"{self._base_url}{path}"
-        if params:
-            url = f"{url}?{urlencode(params)}"
-        headers = {}
-        if path.startswith("/api/admin/"):
-            if admin_token == "use-default":
-                headers["Authorization"] = f"Bearer {self._admin_token}"
-            elif admin_token:
-                headers["Authorization"] = f"Bearer {admin_token}"
-        request = Request(url, headers=headers, method="DELETE")
-        try:
-            with urlopen(request) as response:
-                return response.status, json.loads(response.read().decode("utf-8"))
-        except HTTPError as err:
-            body = err.read().decode("utf-8")
-            return err.code, json.loads(body)
+        return self._request_json("DELETE", path, params=params, admin_token=admin_token)
 
     def test_booking_overlaps_block_is_rejected(self) -> None:
         status, block_payload = self._post_json(
@@ -152,12 +115,7 @@ class AdminBlocksAndPendingExpirationTest(unittest.TestCase):
         self.assertIn("price", hold_payload)
 
     def test_slot_allows_two_bookings_but_rejects_third(self) -> None:
-        payload = {
-            "trailerType": "GALLER",
-            "rentalType": "TWO_HOURS",
-            "date": "2026-05-09",
-            "startTime": "10:00",
-        }
+        payload = self._HOLD_GALLER_MAY_9
 
         first_status, first_payload = self._post_json("/api/hold", payload)
         self.assertEqual(first_status, 201)
@@ -179,61 +137,39 @@ class AdminBlocksAndPendingExpirationTest(unittest.TestCase):
             "startTime": "10:00",
         }
 
-        status_before, payload_before = self._get_json("/api/availability", params)
-        self.assertEqual(status_before, 200)
-        self.assertEqual(payload_before.get("remaining"), 2)
-        self.assertTrue(payload_before.get("available"))
-
-        hold_payload = {
-            "trailerType": "KAP",
-            "rentalType": "TWO_HOURS",
-            "date": "2026-05-10",
-            "startTime": "10:00",
-        }
-        first_status, _ = self._post_json("/api/hold", hold_payload)
-        self.assertEqual(first_status, 201)
-
-        status_after_first, payload_after_first = self._get_json("/api/availability", params)
-        self.assertEqual(status_after_first, 200)
-        self.assertEqual(payload_after_first.get("remaining"), 1)
-        self.assertTrue(payload_after_first.get("available"))
-
-        second_status, _ = self._post_json("/api/hold", hold_payload)
-        self.assertEqual(second_status, 201)
-
-        status_after_second, payload_after_second = self._get_json("/api/availability", params)
-        self.assertEqual(status_after_second, 200)
-        self.assertEqual(payload_after_second.get("remaining"), 0)
-        self.assertFalse(payload_after_second.get("available"))
+        # (remaining, available) before any hold, then after each of two holds.
+        expectations = [(2, True), (1, True), (0, False)]
+        for step, (remaining, available) in enumerate(expectations):
+            if step:
+                hold_status, _ = self._post_json("/api/hold", self._HOLD_KAP_MAY_10)
+                self.assertEqual(hold_status, 201)
+            with self.subTest(holds=step):
+                status, payload = self._get_json("/api/availability", params)
+                self.assertEqual(status, 200)
+                self.assertEqual(payload.get("remaining"), remaining)
+                self.assertEqual(payload.get("available"), available)
 
     def test_pending_payment_expires_and_no_longer_blocks_slot(self) -> None:
-        start = (datetime.now() - timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+        now = datetime.now()
+        start = (now - timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
         end = start + timedelta(hours=2)
         booking_id, _ = db.create_booking("KAP", "TWO_HOURS", start, end)
         second_booking_id, _ = db.create_booking("KAP", "TWO_HOURS", start, end)
 
-        conn = sqlite3.connect(db.DB_PATH)
-        try:
-            conn.execute(
-                """
-                UPDATE bookings
-                SET status = 'PENDING_PAYMENT',
-                    expires_at = ?
-                WHERE id = ?
-                """,
-                ((datetime.now() - timedelta(minutes=1)).isoformat(timespec="seconds"), booking_id),
-            )
-            conn.execute(
+        expired_at = (now - timedelta(minutes=1)).isoformat(timespec="seconds")
+        with self._conn:
+            self._conn.executemany(
                 """
                 UPDATE bookings
-                SET status = 'CONFIRMED'
+                SET status = ?,
+                    expires_at = COALESCE(?, expires_at)
                 WHERE id = ?
                 """,
-                (second_booking_id,),
+                [
+                    ("PENDING_PAYMENT", expired_at, booking_id),
+                    ("CONFIRMED", None, second_booking_id),
+                ],
             )
-            conn.commit()
-        finally:
-            conn.close()
 
         # Expired pending rows should not consume one of the two slots.
         self.assertTrue(db.check_availability("KAP", start, end))
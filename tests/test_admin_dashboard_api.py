@@ -1,78 +1,31 @@
 import http.client
-import json
-import os
-import threading
 import unittest
 from datetime import datetime
-from http.server import ThreadingHTTPServer
-from pathlib import Path
-from tempfile import TemporaryDirectory
-from urllib.error import HTTPError
 from urllib.parse import urlencode
 from urllib.request import Request, urlopen
 
-import app
 import db
+from _base import ServerTestBase
+from _json_compat import loads
+from _support import HTTP
 
 
-class AdminDashboardApiTest(unittest.TestCase):
-    @classmethod
-    def setUpClass(cls) -> None:
-        cls._tmpdir = TemporaryDirectory()
-        cls._original_db_path = db.DB_PATH
-        cls._original_admin_token = os.environ.get("ADMIN_TOKEN")
-        cls._original_admin_password = os.environ.get("ADMIN_PASSWORD")
-        cls._original_session_secret = os.environ.get("ADMIN_SESSION_SECRET")
-        cls._admin_token = "test-admin-token"
-        cls._admin_password = "test-admin-password"
-        cls._session_secret = "test-admin-session-secret"
-        os.environ["ADMIN_TOKEN"] = cls._admin_token
-        os.environ["ADMIN_PASSWORD"] = cls._admin_password
-        os.environ["ADMIN_SESSION_SECRET"] = cls._session_secret
-        db.DB_PATH = Path(cls._tmpdir.name) / "test_database.db"
-        db.init_db()
-
-        cls._server = ThreadingHTTPServer(("127.0.0.1", 0), app.Handler)
-        cls._thread = threading.Thread(target=cls._server.serve_forever, daemon=True)
-        cls._thread.start()
-        cls._base_url = f"http://127.0.0.1:{cls._server.server_port}"
-
-    @classmethod
-    def tearDownClass(cls) -> None:
-        cls._server.shutdown()
-        cls._server.server_close()
-        cls._thread.join(timeout=2)
-        if cls._original_admin_token is None:
-            os.environ.pop("ADMIN_TOKEN", None)
-        else:
-            os.environ["ADMIN_TOKEN"] = cls._original_admin_token
-        if cls._original_admin_password is None:
-            os.environ.pop("ADMIN_PASSWORD", None)
-        else:
-            os.environ["ADMIN_PASSWORD"] = cls._original_admin_password
-        if cls._original_session_secret is None:
-            os.environ.pop("ADMIN_SESSION_SECRET", None)
-        else:
-            os.environ["ADMIN_SESSION_SECRET"] = cls._original_session_secret
-        db.DB_PATH = cls._original_db_path
-        cls._tmpdir.cleanup()
+class AdminDashboardApiTest(ServerTestBase):
+    ADMIN_TOKEN = True
+    _admin_password = "test-admin-password"
+    _session_secret = "test-admin-session-secret"
+    ENV = {"ADMIN_PASSWORD": _admin_password, "ADMIN_SESSION_SECRET": _session_secret}
 
     def _get_json(self, path: str, params: dict | None = None, admin_token: str | None = "use-default") -> tuple[int, dict]:
-        url = f"{self._base_url}{path}"
         if params:
-            url = f"{url}?{urlencode(params)}"
+            path = f"{path}?{urlencode(params)}"
         headers = {}
         if admin_token == "use-default":
             headers["Authorization"] = f"Bearer {self._admin_token}"
         elif admin_token:
             headers["Authorization"] = f"Bearer {admin_token}"
-        request = Request(url, headers=headers)
-        try:
-            with urlopen(request) as response:
-                return response.status, json.loads(response.read().decode("utf-8"))
-        except HTTPError as err:
-            body = err.read().decode("utf-8")
-            return err.code, json.loads(body)
+        response = HTTP.request("GET", f"{self._base_url}{path}", headers=headers)
+        return response.status, loads(response.data)
 
     def _login_cookie(self) -> str:
         payload = urlencode({"password": self._admin_password})
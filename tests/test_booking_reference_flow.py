@@ -1,70 +1,47 @@
-import json
-import os
+import gzip
+import re
 import sqlite3
-import threading
 import unittest
 from datetime import datetime, timedelta
-from http.server import ThreadingHTTPServer
-from pathlib import Path
-from tempfile import TemporaryDirectory
-from urllib.error import HTTPError
 from urllib.parse import urlencode
-from urllib.request import Request, urlopen
+from urllib.request import urlopen
 
 import app
 import db
+from _base import ServerTestBase
+from _json_compat import dumps, loads
+from _support import HTTP
+from qrcodegen import QrCode
 
+BOOKING_REF_RE = re.compile(r"^DHS-\d{8}-\d{6}$")
+QR_RECT_RE = re.compile(r'<rect x="(\d+)" y="(\d+)" width="(\d+)" height="(\d+)"/>')
+
+
+class BookingReferenceFlowTest(ServerTestBase):
+    ADMIN_TOKEN = True
 
-class BookingReferenceFlowTest(unittest.TestCase):
     @classmethod
     def setUpClass(cls) -> None:
-        cls._tmpdir = TemporaryDirectory()
-        cls._original_db_path = db.DB_PATH
-        cls._original_admin_token = os.environ.get("ADMIN_TOKEN")
-        cls._admin_token = "test-admin-token"
-        os.environ["ADMIN_TOKEN"] = cls._admin_token
-        db.DB_PATH = Path(cls._tmpdir.name) / "test_database.db"
-        db.init_db()
-
-        cls._server = ThreadingHTTPServer(("127.0.0.1", 0), app.Handler)
-        cls._thread = threading.Thread(target=cls._server.serve_forever, daemon=True)
-        cls._thread.start()
-        cls._base_url = f"http://127.0.0.1:{cls._server.server_port}"
+        super().setUpClass()
+        cls._conn = sqlite3.connect(db.DB_PATH)
 
     @classmethod
     def tearDownClass(cls) -> None:
-        cls._server.shutdown()
-        cls._server.server_close()
-        cls._thread.join(timeout=2)
-        if cls._original_admin_token is None:
-            os.environ.pop("ADMIN_TOKEN", None)
-        else:
-            os.environ["ADMIN_TOKEN"] = cls._original_admin_token
-        db.DB_PATH = cls._original_db_path
-        cls._tmpdir.cleanup()
+        cls._conn.close()
+        super().tearDownClass()
 
     def _post_json(self, path: str, payload: dict) -> tuple[int, dict]:
-        request = Request(
+        response = HTTP.request(
+            "POST",
             f"{self._base_url}{path}",
-            data=json.dumps(payload).encode("utf-8"),
+            body=dumps(payload),
             headers={"Content-Type": "application/json"},
-            method="POST",
         )
-        try:
-            with urlopen(request) as response:
-                return response.status, json.loads(response.read().decode("utf-8"))
-        except HTTPError as err:
-            body = err.read().decode("utf-8")
-            return err.code, json.loads(body)
+        return response.status, loads(response.data)
 
     def _post(self, path: str) -> tuple[int, dict]:
-        request = Request(f"{self._base_url}{path}", data=b"", method="POST")
-        try:
-            with urlopen(request) as response:
-                return response.status, json.loads(response.read().decode("utf-8"))
-        except HTTPError as err:
-            body = err.read().decode("utf-8")
-            return err.code, json.loads(body)
+        response = HTTP.request("POST", f"{self._base_url}{path}", body=b"")
+        return response.status, loads(response.data)
 
     def _get_json(self, path: str, params: dict | None = None) -> tuple[int, dict]:
         url = f"{self._base_url}{path}"
@@ -73,13 +50,8 @@ class BookingReferenceFlowTest(unittest.TestCase):
         headers = {}
         if path.startswith("/api/admin/"):
             headers["Authorization"] = f"Bearer {self._admin_token}"
-        request = Request(url, headers=headers)
-        try:
-            with urlopen(request) as response:
-                return response.status, json.loads(response.read().decode("utf-8"))
-        except HTTPError as err:
-            body = err.read().decode("utf-8")
-            return err.code, json.loads(body)
+        response = HTTP.request("GET", url, headers=headers)
+        return response.status, loads(response.data)
 
     def _create_hold(self, date_str: str, start_time: str = "10:00") -> dict:
         status, payload = self._post_json(
@@ -101,7 +73,7 @@ class BookingReferenceFlowTest(unittest.TestCase):
         booking_id = payload["bookingId"]
         booking_reference = payload["bookingReference"]
         self.assertIsNotNone(booking_reference)
-        self.assertRegex(booking_reference, r"^DHS-\d{8}-\d{6}$")
+        self.assertRegex(booking_reference, BOOKING_REF_RE)
 
         booking = db.get_booking_by_id(booking_id)
         self.assertIsNotNone(booking)
@@ -112,16 +84,12 @@ class BookingReferenceFlowTest(unittest.TestCase):
         second = self._create_hold("2026-04-11", "13:00")
         self.assertNotEqual(first["bookingReference"], second["bookingReference"])
 
-        conn = sqlite3.connect(db.DB_PATH)
-        try:
-            with self.assertRaises(sqlite3.IntegrityError):
-                conn.execute(
+        with self.assertRaises(sqlite3.IntegrityError):
+            with self._conn:
+                self._conn.execute(
                     "UPDATE bookings SET booking_reference = ? WHERE id = ?",
                     (first["bookingReference"], second["bookingId"]),
                 )
-                conn.commit()
-        finally:
-            conn.close()
 
     def test_reference_returned_in_api_responses(self) -> None:
         hold = self._create_hold("2026-04-12")
@@ -144,9 +112,9 @@ class BookingReferenceFlowTest(unittest.TestCase):
     def test_old_booking_without_reference_does_not_crash_endpoints(self) -> None:
         start = datetime(2026, 4, 13, 10, 0)
         end = start + timedelta(hours=2)
-        conn = sqlite3.connect(db.DB_PATH)
-        try:
-            cur = conn.execute(
+        now = datetime.now()
+        with self._conn:
+            cur = self._conn.execute(
                 """
                 INSERT INTO bookings (
                     booking_reference,
@@ -165,14 +133,11 @@ class BookingReferenceFlowTest(unittest.TestCase):
                 (
                     start.isoformat(timespec="minutes"),
                     end.isoformat(timespec="minutes"),
-                    datetime.now().isoformat(timespec="seconds"),
-                    (datetime.now() + timedelta(minutes=10)).isoformat(timespec="seconds"),
+                    now.isoformat(timespec="seconds"),
+                    (now + timedelta(minutes=10)).isoformat(timespec="seconds"),
                 ),
             )
             old_booking_id = cur.lastrowid
-            conn.commit()
-        finally:
-            conn.close()
 
         payment_status, payment = self._get_json("/api/payment", {"bookingId": old_booking_id})
         self.assertEqual(payment_status, 200)
@@ -222,13 +187,12 @@ class BookingReferenceFlowTest(unittest.TestCase):
             self.assertEqual(qr_resp.headers.get_content_type(), "image/svg+xml")
 
     def test_swish_paymentrequest_creates_token_for_future_pending_booking(self) -> None:
-        start = datetime.now() + timedelta(days=2)
-        start = start.replace(hour=8, minute=0, second=0, microsecond=0)
+        now = datetime.now()
+        start = (now + timedelta(days=2)).replace(hour=8, minute=0, second=0, microsecond=0)
         end = start + timedelta(hours=2)
 
-        conn = sqlite3.connect(db.DB_PATH)
-        try:
-            cur = conn.execute(
+        with self._conn:
+            cur = self._conn.execute(
                 """
                 INSERT INTO bookings (
                     booking_reference,
@@ -247,14 +211,11 @@ class BookingReferenceFlowTest(unittest.TestCase):
                 (
                     start.isoformat(timespec="minutes"),
                     end.isoformat(timespec="minutes"),
-                    datetime.now().isoformat(timespec="seconds"),
-                    (datetime.now() - timedelta(minutes=30)).isoformat(timespec="seconds"),
+                    now.isoformat(timespec="seconds"),
+                    (now - timedelta(minutes=30)).isoformat(timespec="seconds"),
                 ),
             )
             booking_id = cur.lastrowid
-            conn.commit()
-        finally:
-            conn.close()
 
         status, payload = self._post(f"/api/swish/paymentrequest?bookingId={booking_id}")
         self.assertEqual(status, 200)
@@ -272,6 +233,17 @@ class BookingReferenceFlowTest(unittest.TestCase):
             self.assertEqual(qr_resp.headers.get_content_type(), "image/svg+xml")
             self.assertIn("<svg", qr_resp.read().decode("utf-8"))
 
+        gzip_resp = HTTP.request(
+            "GET",
+            f"{self._base_url}/api/swish/qr?bookingId={booking_id}",
+            headers={"Accept-Encoding": "gzip"},
+            decode_content=False,
+        )
+        self.assertEqual(gzip_resp.status, 200)
+        self.assertEqual(gzip_resp.headers.get("Content-Encoding"), "gzip")
+        self.assertEqual(gzip_resp.headers.get("Vary"), "Accept-Encoding")
+        self.assertIn(b"<svg", gzip.decompress(gzip_resp.data))
+
     def test_payment_status_stays_pending_without_explicit_swish_confirmation(self) -> None:
         hold = self._create_hold("2026-04-15")
         booking_id = hold["bookingId"]
@@ -279,15 +251,11 @@ class BookingReferenceFlowTest(unittest.TestCase):
         status, _ = self._post(f"/api/swish/paymentrequest?bookingId={booking_id}")
         self.assertEqual(status, 200)
 
-        conn = sqlite3.connect(db.DB_PATH)
-        try:
-            conn.execute(
+        with self._conn:
+            self._conn.execute(
                 "UPDATE bookings SET swish_created_at = ? WHERE id = ?",
                 ((datetime.now() - timedelta(seconds=20)).isoformat(timespec="seconds"), booking_id),
             )
-            conn.commit()
-        finally:
-            conn.close()
 
         payment_status, payload = self._get_json("/api/payment-status", {"bookingId": booking_id})
         self.assertEqual(payment_status, 200)
@@ -298,5 +266,41 @@ class BookingReferenceFlowTest(unittest.TestCase):
         self.assertEqual(booking.get("status"), "PENDING_PAYMENT")
 
 
+class QrSvgRenderTest(unittest.TestCase):
+    def test_merged_rects_cover_exactly_the_dark_modules(self) -> None:
+        payload = "swish://paymentrequest?token=" + "a" * 64 + "&callbackurl=https://example.com/cb"
+        qr = QrCode.encode_text(payload, QrCode.Ecc.MEDIUM)
+        size = qr.get_size()
+        border = 2
+        scale = max(1, 320 // (size + border * 2))
+
+        svg = app._render_qr_svg(payload, size=320, border=border)
+
+        painted: set[tuple[int, int]] = set()
+        for x, y, width, height in QR_RECT_RE.findall(svg):
+            self.assertEqual(int(height), scale)
+            column, row = int(x) // scale - border, int(y) // scale - border
+            for offset in range(int(width) // scale):
+                self.assertNotIn((column + offset, row), painted)
+                painted.add((column + offset, row))
+        dark = {(x, y) for y in range(size) for x in range(size) if qr.get_module(x, y)}
+        self.assertEqual(painted, dark)
+        self.assertLess(len(QR_RECT_RE.findall(svg)), len(dark))
+
+    def test_served_bodies_are_cached_with_a_gzipped_copy(self) -> None:
+        body, gzipped = app._qr_svg_bodies("swish://paymentrequest?token=abc", size=320)
+        self.assertIs(app._qr_svg_bodies("swish://paymentrequest?token=abc", size=320)[0], body)
+        self.assertEqual(body, app._render_qr_svg("swish://paymentrequest?token=abc", size=320).encode("utf-8"))
+        self.assertEqual(gzip.decompress(gzipped), body)
+        self.assertLess(len(gzipped), len(body))
+
+    def test_accepts_gzip(self) -> None:
+        self.assertTrue(app._accepts_gzip("gzip, deflate, br"))
+        self.assertTrue(app._accepts_gzip("br;q=1.0, gzip;q=0.8"))
+        self.assertFalse(app._accepts_gzip(""))
+        self.assertFalse(app._accepts_gzip("identity"))
+        self.assertFalse(app._accepts_gzip("gzip;q=0"))
+
+
 if __name__ == "__main__":
     unittest.main()
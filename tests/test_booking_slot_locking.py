@@ -1,71 +1,48 @@
-import json
 import threading
 import unittest
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import date, timedelta
-from http.server import ThreadingHTTPServer
-from pathlib import Path
-from tempfile import TemporaryDirectory
-from urllib.error import HTTPError
-from urllib.request import Request, urlopen
 
-import app
-import db
+from _base import ServerTestBase
+from _json_compat import dumps, loads
+from _support import HTTP
 
 
-class BookingSlotLockingTest(unittest.TestCase):
+class BookingSlotLockingTest(ServerTestBase):
+    _PARTICIPANTS = 3
+    _ROUNDS = 20
+    _CONCURRENT_ROUNDS = 2
+
     @classmethod
     def setUpClass(cls) -> None:
-        cls._tmpdir = TemporaryDirectory()
-        cls._original_db_path = db.DB_PATH
-        db.DB_PATH = Path(cls._tmpdir.name) / "test_database.db"
-        db.init_db()
-
-        cls._server = ThreadingHTTPServer(("127.0.0.1", 0), app.Handler)
-        cls._thread = threading.Thread(target=cls._server.serve_forever, daemon=True)
-        cls._thread.start()
-        cls._base_url = f"http://127.0.0.1:{cls._server.server_port}"
+        super().setUpClass()
+        # Enough workers for several rounds at once without overflowing the
+        # server's listen backlog (socketserver's request_queue_size is 5).
+        cls._pool = ThreadPoolExecutor(max_workers=cls._PARTICIPANTS * cls._CONCURRENT_ROUNDS)
 
     @classmethod
     def tearDownClass(cls) -> None:
-        cls._server.shutdown()
-        cls._server.server_close()
-        cls._thread.join(timeout=2)
-        db.DB_PATH = cls._original_db_path
-        cls._tmpdir.cleanup()
-
-    def _post_hold(self, payload: dict) -> tuple[int, dict]:
-        request = Request(
+        cls._pool.shutdown(wait=True)
+        super().tearDownClass()
+
+    def _post_hold(self, body: bytes) -> tuple[int, dict]:
+        response = HTTP.request(
+            "POST",
             f"{self._base_url}/api/hold",
-            data=json.dumps(payload).encode("utf-8"),
+            body=body,
             headers={"Content-Type": "application/json"},
-            method="POST",
         )
-        try:
-            with urlopen(request) as response:
-                return response.status, json.loads(response.read().decode("utf-8"))
-        except HTTPError as err:
-            body = err.read().decode("utf-8")
-            return err.code, json.loads(body)
-
-    def _run_request_race(self, payload: dict, participants: int) -> list[tuple[int, dict]]:
-        barrier = threading.Barrier(participants)
-        results: list[tuple[int, dict]] = []
-        lock = threading.Lock()
-
-        def worker() -> None:
-            barrier.wait()
-            result = self._post_hold(payload)
-            with lock:
-                results.append(result)
+        return response.status, loads(response.data)
+
+    def _start_request_race(self, body: bytes, participants: int) -> list[Future]:
+        """Submit participants that POST the same pre-encoded hold body at once."""
+        barrier = threading.Barrier(participants, timeout=10)
 
-        threads = [threading.Thread(target=worker) for _ in range(participants)]
-        for t in threads:
-            t.start()
-        for t in threads:
-            t.join(timeout=5)
-            self.assertFalse(t.is_alive(), "race worker did not finish")
+        def worker() -> tuple[int, dict]:
+            barrier.wait()
+            return self._post_hold(body)
 
-        return results
+        return [self._pool.submit(worker) for _ in range(participants)]
 
     def test_atomic_slot_locking_under_race(self) -> None:
         trailer_type = "GALLER"
@@ -73,17 +50,25 @@ class BookingSlotLockingTest(unittest.TestCase):
         start_time = "10:00"
         base_date = date(2026, 3, 1)
 
-        for round_index in range(20):
+        # Each round races on its own date, so rounds can overlap.
+        races = []
+        for round_index in range(self._ROUNDS):
+            race_date = (base_date + timedelta(days=round_index)).isoformat()
+            payload = {
+                "trailerType": trailer_type,
+                "rentalType": rental_type,
+                "date": race_date,
+                "startTime": start_time,
+            }
+            races.append(self._start_request_race(dumps(payload), participants=self._PARTICIPANTS))
+
+        _, not_done = wait([future for race in races for future in race], timeout=30)
+        self.assertFalse(not_done, "race worker did not finish")
+
+        for round_index, race in enumerate(races):
             with self.subTest(round=round_index + 1):
-                race_date = (base_date + timedelta(days=round_index)).isoformat()
-                payload = {
-                    "trailerType": trailer_type,
-                    "rentalType": rental_type,
-                    "date": race_date,
-                    "startTime": start_time,
-                }
-                results = self._run_request_race(payload, participants=3)
-                self.assertEqual(len(results), 3)
+                results = [future.result() for future in race]
+                self.assertEqual(len(results), self._PARTICIPANTS)
 
                 statuses = sorted(status for status, _ in results)
                 self.assertEqual(statuses, [201, 201, 409])
@@ -1,29 +1,38 @@
-import json
-import os
-import threading
+import sqlite3
 import unittest
 from datetime import datetime, timedelta
-from http.server import ThreadingHTTPServer
 from pathlib import Path
-from tempfile import TemporaryDirectory
 from unittest import mock
-from urllib.error import HTTPError
-from urllib.request import Request, urlopen
 
 import app
 import db
+from _base import ServerTestBase
+from _json_compat import dumps, loads
+from _support import HTTP, init_test_db, tmp_dir
 
 
 class EphemeralTestBookingsProcessTest(unittest.TestCase):
-    def setUp(self) -> None:
-        self._tmpdir = TemporaryDirectory()
-        self._original_db_path = db.DB_PATH
-        db.DB_PATH = Path(self._tmpdir.name) / "test_database.db"
-        db.init_db()
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls._tmpdir = tmp_dir()
+        cls._original_db_path = db.DB_PATH
+        db.DB_PATH = Path(cls._tmpdir.name) / "test_database.db"
+        init_test_db()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        db.DB_PATH = cls._original_db_path
+        cls._tmpdir.cleanup()
 
-    def tearDown(self) -> None:
-        db.DB_PATH = self._original_db_path
-        self._tmpdir.cleanup()
+    def setUp(self) -> None:
+        # One database per class; empty it instead of rebuilding it per test.
+        conn = sqlite3.connect(db.DB_PATH)
+        try:
+            with conn:
+                conn.execute("DELETE FROM test_bookings")
+                conn.execute("DELETE FROM bookings")
+        finally:
+            conn.close()
 
     def test_process_due_test_bookings_immediate_paid_sms_and_delete_idempotent(self) -> None:
         now = datetime(2026, 2, 19, 12, 0, 0)
@@ -60,34 +69,8 @@ class EphemeralTestBookingsProcessTest(unittest.TestCase):
                 self.assertEqual(send_sms_mock.call_count, 2)
 
 
-class EphemeralTestBookingsApiTest(unittest.TestCase):
-    @classmethod
-    def setUpClass(cls) -> None:
-        cls._tmpdir = TemporaryDirectory()
-        cls._original_db_path = db.DB_PATH
-        cls._original_admin_token = os.environ.get("ADMIN_TOKEN")
-        cls._admin_token = "test-admin-token"
-
-        os.environ["ADMIN_TOKEN"] = cls._admin_token
-        db.DB_PATH = Path(cls._tmpdir.name) / "test_database.db"
-        db.init_db()
-
-        cls._server = ThreadingHTTPServer(("127.0.0.1", 0), app.Handler)
-        cls._thread = threading.Thread(target=cls._server.serve_forever, daemon=True)
-        cls._thread.start()
-        cls._base_url = f"http://127.0.0.1:{cls._server.server_port}"
-
-    @classmethod
-    def tearDownClass(cls) -> None:
-        cls._server.shutdown()
-        cls._server.server_close()
-        cls._thread.join(timeout=2)
-        if cls._original_admin_token is None:
-            os.environ.pop("ADMIN_TOKEN", None)
-        else:
-            os.environ["ADMIN_TOKEN"] = cls._original_admin_token
-        db.DB_PATH = cls._original_db_path
-        cls._tmpdir.cleanup()
+class EphemeralTestBookingsApiTest(ServerTestBase):
+    ADMIN_TOKEN = True
 
     def _request_json(
         self,
@@ -104,17 +87,13 @@ class EphemeralTestBookingsApiTest(unittest.TestCase):
         elif admin_token:
             headers["X-Admin-Token"] = admin_token
 
-        req = Request(
+        response = HTTP.request(
+            method,
             f"{self._base_url}{path}",
-            data=(json.dumps(payload).encode("utf-8") if payload is not None else None),
+            body=(dumps(payload) if payload is not None else None),
             headers=headers,
-            method=method,
         )
-        try:
-            with urlopen(req) as response:
-                return response.status, json.loads(response.read().decode("utf-8"))
-        except HTTPError as err:
-            return err.code, json.loads(err.read().decode("utf-8"))
+        return response.status, loads(response.data)
 
     def test_admin_test_bookings_requires_token(self) -> None:
         status, payload = self._request_json("GET", "/api/admin/test-bookings", admin_token=None)
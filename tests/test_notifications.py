@@ -1,17 +1,13 @@
-import json
 import os
-import threading
 import unittest
-from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from pathlib import Path
-from tempfile import TemporaryDirectory
-from urllib.error import HTTPError
-from urllib.request import Request, urlopen
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 import app
 import db
 import notifications
+from _base import ServerTestBase
+from _json_compat import dumps, loads
+from _support import HTTP
 
 
 class _RecordingNotifier:
@@ -29,42 +25,36 @@ class _RecordingNotifier:
         self.confirmed_calls.append(booking)
 
 
-class NotificationsTest(unittest.TestCase):
+_WEBHOOK_URL = "https://script.example.com/exec"
+
+
+def _webhook_response(status_code: int, text: str) -> Mock:
+    response = Mock()
+    response.status_code = status_code
+    response.text = text
+    response.headers = {"Location": "/final"}
+    return response
+
+
+class NotificationsTest(ServerTestBase):
     @classmethod
     def setUpClass(cls) -> None:
-        cls._tmpdir = TemporaryDirectory()
-        cls._original_db_path = db.DB_PATH
-        db.DB_PATH = Path(cls._tmpdir.name) / "test_database.db"
-        db.init_db()
-
+        super().setUpClass()
         cls._original_notifier = app.NOTIFIER
-        cls._server = ThreadingHTTPServer(("127.0.0.1", 0), app.Handler)
-        cls._thread = threading.Thread(target=cls._server.serve_forever, daemon=True)
-        cls._thread.start()
-        cls._base_url = f"http://127.0.0.1:{cls._server.server_port}"
 
     @classmethod
     def tearDownClass(cls) -> None:
         app.NOTIFIER = cls._original_notifier
-        cls._server.shutdown()
-        cls._server.server_close()
-        cls._thread.join(timeout=2)
-        db.DB_PATH = cls._original_db_path
-        cls._tmpdir.cleanup()
+        super().tearDownClass()
 
     def _post_json(self, path: str, payload: dict) -> tuple[int, dict]:
-        request = Request(
+        response = HTTP.request(
+            "POST",
             f"{self._base_url}{path}",
-            data=json.dumps(payload).encode("utf-8"),
+            body=dumps(payload),
             headers={"Content-Type": "application/json"},
-            method="POST",
         )
-        try:
-            with urlopen(request) as response:
-                return response.status, json.loads(response.read().decode("utf-8"))
-        except HTTPError as err:
-            body = err.read().decode("utf-8")
-            return err.code, json.loads(body)
+        return response.status, loads(response.data)
 
     def test_build_booking_payload(self) -> None:
         booking = {
@@ -93,24 +83,14 @@ class NotificationsTest(unittest.TestCase):
         )
 
     def test_create_notification_service_does_not_enable_generic_webhook_provider(self) -> None:
-        old_url = os.environ.get("NOTIFY_WEBHOOK_URL")
-        old_secret = os.environ.get("NOTIFY_WEBHOOK_SECRET")
-        os.environ["NOTIFY_WEBHOOK_URL"] = "https://example.com/webhook"
-        os.environ["NOTIFY_WEBHOOK_SECRET"] = "secret"
-        try:
+        with patch.dict(
+            os.environ,
+            {"NOTIFY_WEBHOOK_URL": "https://example.com/webhook", "NOTIFY_WEBHOOK_SECRET": "secret"},
+        ):
             service = notifications.create_notification_service_from_env()
-            provider_types = {provider.__class__.__name__ for provider in service.providers}
-            self.assertIn("LogNotificationProvider", provider_types)
-            self.assertNotIn("WebhookNotificationProvider", provider_types)
-        finally:
-            if old_url is None:
-                os.environ.pop("NOTIFY_WEBHOOK_URL", None)
-            else:
-                os.environ["NOTIFY_WEBHOOK_URL"] = old_url
-            if old_secret is None:
-                os.environ.pop("NOTIFY_WEBHOOK_SECRET", None)
-            else:
-                os.environ["NOTIFY_WEBHOOK_SECRET"] = old_secret
+        provider_types = {provider.__class__.__name__ for provider in service.providers}
+        self.assertIn("LogNotificationProvider", provider_types)
+        self.assertNotIn("WebhookNotificationProvider", provider_types)
 
     def test_booking_creation_succeeds_when_notifier_raises(self) -> None:
         app.NOTIFIER = _RecordingNotifier(raise_on_created=True)
@@ -159,37 +139,11 @@ class NotificationsTest(unittest.TestCase):
         self.assertEqual(recorder.confirmed_calls[0].get("status"), "CONFIRMED")
 
     def test_paid_callback_clears_receipt_temp_fields_when_webhook_returns_302(self) -> None:
-        requests_seen: list[str] = []
-
-        class _Handler(BaseHTTPRequestHandler):
-            def log_message(self, format: str, *args) -> None:  # type: ignore[override]
-                return
-
-            def do_POST(self) -> None:  # noqa: N802
-                content_length = int(self.headers.get("Content-Length", "0"))
-                self.rfile.read(content_length)
-                requests_seen.append(self.path)
-
-                if self.path == "/exec":
-                    self.send_response(302)
-                    self.send_header("Location", "/final")
-                    self.end_headers()
-                    self.wfile.write(b"redirect")
-                    return
-
-                self.send_response(405)
-                self.end_headers()
-                self.wfile.write(b"method not allowed")
-
-        server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
-        thread = threading.Thread(target=server.serve_forever, daemon=True)
-        thread.start()
-        old_url = os.environ.get("NOTIFY_WEBHOOK_URL")
-        old_secret = os.environ.get("NOTIFY_WEBHOOK_SECRET")
-        try:
-            os.environ["NOTIFY_WEBHOOK_URL"] = f"http://127.0.0.1:{server.server_port}/exec"
-            os.environ["NOTIFY_WEBHOOK_SECRET"] = "test-secret"
-
+        webhook_env = {"NOTIFY_WEBHOOK_URL": _WEBHOOK_URL, "NOTIFY_WEBHOOK_SECRET": "test-secret"}
+        with (
+            patch.dict(os.environ, webhook_env),
+            patch.object(notifications._SESSION, "post", return_value=_webhook_response(302, "redirect")) as mock_post,
+        ):
             create_status, create_payload = self._post_json(
                 "/api/hold",
                 {
@@ -208,30 +162,21 @@ class NotificationsTest(unittest.TestCase):
                 "/api/swish/callback",
                 {"paymentReference": booking_id, "status": "PAID"},
             )
-            self.assertEqual(callback_status, 200)
-            self.assertTrue(callback_payload.get("ok"))
-            self.assertEqual(requests_seen, ["/exec"])
-
-            booking = db.get_booking_by_id(booking_id)
-            self.assertIsNotNone(booking)
-            self.assertIsNone(booking.get("customer_email_temp"))
-            self.assertEqual(booking.get("receipt_requested_temp"), 0)
-        finally:
-            if old_url is None:
-                os.environ.pop("NOTIFY_WEBHOOK_URL", None)
-            else:
-                os.environ["NOTIFY_WEBHOOK_URL"] = old_url
-            if old_secret is None:
-                os.environ.pop("NOTIFY_WEBHOOK_SECRET", None)
-            else:
-                os.environ["NOTIFY_WEBHOOK_SECRET"] = old_secret
-            server.shutdown()
-            server.server_close()
-            thread.join(timeout=2)
+            notifications._flush_webhook_queue()
+        self.assertEqual(callback_status, 200)
+        self.assertTrue(callback_payload.get("ok"))
+        mock_post.assert_called_once()
+        self.assertEqual(mock_post.call_args.args[0], _WEBHOOK_URL)
+        self.assertIs(mock_post.call_args.kwargs["allow_redirects"], False)
+
+        booking = db.get_booking_by_id(booking_id)
+        self.assertIsNotNone(booking)
+        self.assertIsNone(booking.get("customer_email_temp"))
+        self.assertEqual(booking.get("receipt_requested_temp"), 0)
 
 
 class ReceiptWebhookRedirectHandlingTest(unittest.TestCase):
-    @patch("notifications.requests.post")
+    @patch.object(notifications._SESSION, "post")
     def test_send_receipt_webhook_treats_initial_http_302_as_success(self, mock_post) -> None:
         mock_response = unittest.mock.Mock()
         mock_response.status_code = 302
@@ -239,11 +184,10 @@ class ReceiptWebhookRedirectHandlingTest(unittest.TestCase):
         mock_response.headers = {"Location": "https://script.googleusercontent.com/macros/echo"}
         mock_post.return_value = mock_response
 
-        old_url = os.environ.get("NOTIFY_WEBHOOK_URL")
-        old_secret = os.environ.get("NOTIFY_WEBHOOK_SECRET")
-        os.environ["NOTIFY_WEBHOOK_URL"] = "https://example.com/exec"
-        os.environ["NOTIFY_WEBHOOK_SECRET"] = "test-secret"
-        try:
+        with patch.dict(
+            os.environ,
+            {"NOTIFY_WEBHOOK_URL": "https://example.com/exec", "NOTIFY_WEBHOOK_SECRET": "test-secret"},
+        ):
             ok = notifications.send_receipt_webhook(
                 {
                     "id": 123,
@@ -256,86 +200,40 @@ class ReceiptWebhookRedirectHandlingTest(unittest.TestCase):
                     "receipt_requested_temp": 1,
                 }
             )
-            self.assertTrue(ok)
-        finally:
-            if old_url is None:
-                os.environ.pop("NOTIFY_WEBHOOK_URL", None)
-            else:
-                os.environ["NOTIFY_WEBHOOK_URL"] = old_url
-            if old_secret is None:
-                os.environ.pop("NOTIFY_WEBHOOK_SECRET", None)
-            else:
-                os.environ["NOTIFY_WEBHOOK_SECRET"] = old_secret
-
-    def _run_send_receipt_webhook_server_test(self, first_status: int, first_body: str) -> tuple[bool, list[str]]:
-        requests_seen: list[str] = []
-
-        class _Handler(BaseHTTPRequestHandler):
-            def log_message(self, format: str, *args) -> None:  # type: ignore[override]
-                return
-
-            def do_POST(self) -> None:  # noqa: N802
-                content_length = int(self.headers.get("Content-Length", "0"))
-                self.rfile.read(content_length)
-                requests_seen.append(self.path)
-
-                if self.path == "/exec":
-                    self.send_response(first_status)
-                    self.send_header("Location", "/final")
-                    self.end_headers()
-                    self.wfile.write(first_body.encode("utf-8"))
-                    return
-
-                self.send_response(404)
-                self.end_headers()
-                self.wfile.write(b"not found")
-
-        server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
-        thread = threading.Thread(target=server.serve_forever, daemon=True)
-        thread.start()
-        try:
-            url = f"http://127.0.0.1:{server.server_port}/exec"
-            old_url = os.environ.get("NOTIFY_WEBHOOK_URL")
-            old_secret = os.environ.get("NOTIFY_WEBHOOK_SECRET")
-            os.environ["NOTIFY_WEBHOOK_URL"] = url
-            os.environ["NOTIFY_WEBHOOK_SECRET"] = "test-secret"
-            try:
-                result = notifications.send_receipt_webhook(
-                    {
-                        "id": 123,
-                        "booking_reference": "DHS-20260219-000001",
-                        "trailer_type": "KAP",
-                        "start_dt": "2026-02-20T10:00",
-                        "end_dt": "2026-02-20T12:00",
-                        "price": 200,
-                        "customer_email_temp": "test@example.com",
-                        "receipt_requested_temp": 1,
-                    }
-                )
-                return result, requests_seen
-            finally:
-                if old_url is None:
-                    os.environ.pop("NOTIFY_WEBHOOK_URL", None)
-                else:
-                    os.environ["NOTIFY_WEBHOOK_URL"] = old_url
-                if old_secret is None:
-                    os.environ.pop("NOTIFY_WEBHOOK_SECRET", None)
-                else:
-                    os.environ["NOTIFY_WEBHOOK_SECRET"] = old_secret
-        finally:
-            server.shutdown()
-            server.server_close()
-            thread.join(timeout=2)
+        self.assertTrue(ok)
+
+    def _run_send_receipt_webhook(self, status_code: int, text: str) -> tuple[bool, list[str]]:
+        """Send one receipt webhook against a stubbed POST; return the result and URLs posted to."""
+        webhook_env = {"NOTIFY_WEBHOOK_URL": _WEBHOOK_URL, "NOTIFY_WEBHOOK_SECRET": "test-secret"}
+        with (
+            patch.dict(os.environ, webhook_env),
+            patch.object(notifications._SESSION, "post", return_value=_webhook_response(status_code, text)) as mock_post,
+        ):
+            result = notifications.send_receipt_webhook(
+                {
+                    "id": 123,
+                    "booking_reference": "DHS-20260219-000001",
+                    "trailer_type": "KAP",
+                    "start_dt": "2026-02-20T10:00",
+                    "end_dt": "2026-02-20T12:00",
+                    "price": 200,
+                    "customer_email_temp": "test@example.com",
+                    "receipt_requested_temp": 1,
+                }
+            )
+        for call in mock_post.call_args_list:
+            self.assertIs(call.kwargs["allow_redirects"], False)
+        return result, [call.args[0] for call in mock_post.call_args_list]
 
     def test_send_receipt_webhook_accepts_302_and_does_not_follow_redirect(self) -> None:
-        ok, requests_seen = self._run_send_receipt_webhook_server_test(302, "redirect")
+        ok, urls_posted = self._run_send_receipt_webhook(302, "redirect")
         self.assertTrue(ok)
-        self.assertEqual(requests_seen, ["/exec"])
+        self.assertEqual(urls_posted, [_WEBHOOK_URL])
 
     def test_send_receipt_webhook_fail_on_405(self) -> None:
-        ok, requests_seen = self._run_send_receipt_webhook_server_test(405, "method not allowed")
+        ok, urls_posted = self._run_send_receipt_webhook(405, "method not allowed")
         self.assertFalse(ok)
-        self.assertEqual(requests_seen, ["/exec"])
+        self.assertEqual(urls_posted, [_WEBHOOK_URL])
 
 
 if __name__ == "__main__":
@@ -1,74 +1,61 @@
-import json
-import os
-import threading
 import unittest
-from http.server import ThreadingHTTPServer
-from pathlib import Path
-from tempfile import TemporaryDirectory
+from datetime import datetime
 from unittest import mock
-from urllib.error import HTTPError
-from urllib.request import Request, urlopen
 
-import app
 import db
+from _base import ServerTestBase
+from _json_compat import dumps, loads
+from _support import HTTP
 
 
-class PaidSmsIdempotencyTest(unittest.TestCase):
+_ADMIN_NUMBER = "+46709663485"
+
+
+class PaidSmsIdempotencyTest(ServerTestBase):
+    ADMIN_TOKEN = True
+
     @classmethod
     def setUpClass(cls) -> None:
-        cls._tmpdir = TemporaryDirectory()
-        cls._original_db_path = db.DB_PATH
-        cls._original_admin_token = os.environ.get("ADMIN_TOKEN")
-        cls._admin_token = "test-admin-token"
-        os.environ["ADMIN_TOKEN"] = cls._admin_token
-        db.DB_PATH = Path(cls._tmpdir.name) / "test_database.db"
-        db.init_db()
-
-        cls._server = ThreadingHTTPServer(("127.0.0.1", 0), app.Handler)
-        cls._thread = threading.Thread(target=cls._server.serve_forever, daemon=True)
-        cls._thread.start()
-        cls._base_url = f"http://127.0.0.1:{cls._server.server_port}"
+        super().setUpClass()
+        # Pending bookings for the tests that only exercise /api/dev/swish/mark,
+        # inserted directly instead of through /api/hold.
+        cls._retry_booking_id, _ = db.create_booking(
+            "KAP",
+            "TWO_HOURS",
+            datetime(2026, 7, 13, 11, 0),
+            datetime(2026, 7, 13, 13, 0),
+            customer_phone_temp="+46705556677",
+        )
+        cls._cancel_booking_id, _ = db.create_booking(
+            "GALLER",
+            "TWO_HOURS",
+            datetime(2026, 7, 14, 12, 0),
+            datetime(2026, 7, 14, 14, 0),
+            customer_phone_temp="+46709998877",
+        )
 
-    @classmethod
-    def tearDownClass(cls) -> None:
-        cls._server.shutdown()
-        cls._server.server_close()
-        cls._thread.join(timeout=2)
-        if cls._original_admin_token is None:
-            os.environ.pop("ADMIN_TOKEN", None)
-        else:
-            os.environ["ADMIN_TOKEN"] = cls._original_admin_token
-        db.DB_PATH = cls._original_db_path
-        cls._tmpdir.cleanup()
+    def setUp(self) -> None:
+        super().setUp()
+        admin_patcher = mock.patch("sms_provider.get_admin_sms_number_e164", return_value=_ADMIN_NUMBER)
+        send_patcher = mock.patch("sms_provider.send_sms", return_value=True)
+        admin_patcher.start()
+        self._send_sms = send_patcher.start()
+        self.addCleanup(admin_patcher.stop)
+        self.addCleanup(send_patcher.stop)
 
     def _post_json(self, path: str, payload: dict, *, auth: bool = False) -> tuple[int, dict]:
         headers = {"Content-Type": "application/json"}
         if auth:
             headers["Authorization"] = f"Bearer {self._admin_token}"
-        request = Request(
-            f"{self._base_url}{path}",
-            data=json.dumps(payload).encode("utf-8"),
-            headers=headers,
-            method="POST",
-        )
-        try:
-            with urlopen(request) as response:
-                return response.status, json.loads(response.read().decode("utf-8"))
-        except HTTPError as err:
-            body = err.read().decode("utf-8")
-            return err.code, json.loads(body)
+        response = HTTP.request("POST", f"{self._base_url}{path}", body=dumps(payload), headers=headers)
+        return response.status, loads(response.data)
 
     def _post(self, path: str, *, auth: bool = False) -> tuple[int, dict]:
         headers = {}
         if auth:
             headers["Authorization"] = f"Bearer {self._admin_token}"
-        request = Request(f"{self._base_url}{path}", data=b"", headers=headers, method="POST")
-        try:
-            with urlopen(request) as response:
-                return response.status, json.loads(response.read().decode("utf-8"))
-        except HTTPError as err:
-            body = err.read().decode("utf-8")
-            return err.code, json.loads(body)
+        response = HTTP.request("POST", f"{self._base_url}{path}", body=b"", headers=headers)
+        return response.status, loads(response.data)
 
     def test_paid_sms_sent_once_and_customer_phone_cleared(self) -> None:
         status, payload = self._post_json(
@@ -84,29 +71,19 @@ class PaidSmsIdempotencyTest(unittest.TestCase):
         self.assertEqual(status, 201)
         booking_id = payload["bookingId"]
 
-        sent_calls: list[tuple[str, str]] = []
-
-        def fake_send_sms(to_e164: str, message: str) -> bool:
-            sent_calls.append((to_e164, message))
-            return True
-
-        with mock.patch("sms_provider.get_admin_sms_number_e164", return_value="+46709663485"), mock.patch(
-            "sms_provider.send_sms", side_effect=fake_send_sms
-        ):
-            first_status, _ = self._post(
-                f"/api/dev/swish/mark?bookingId={booking_id}&status=PAID",
-                auth=True,
-            )
-            second_status, _ = self._post(
-                f"/api/dev/swish/mark?bookingId={booking_id}&status=PAID",
-                auth=True,
-            )
+        first_status, _ = self._post(
+            f"/api/dev/swish/mark?bookingId={booking_id}&status=PAID",
+            auth=True,
+        )
+        second_status, _ = self._post(
+            f"/api/dev/swish/mark?bookingId={booking_id}&status=PAID",
+            auth=True,
+        )
 
         self.assertEqual(first_status, 200)
         self.assertEqual(second_status, 200)
-        self.assertEqual(len(sent_calls), 2)
-        self.assertEqual(sent_calls[0][0], "+46709663485")
-        self.assertEqual(sent_calls[1][0], "+46701234567")
+        sent_to = [call.args[0] for call in self._send_sms.call_args_list]
+        self.assertEqual(sent_to, [_ADMIN_NUMBER, "+46701234567"])
 
         booking = db.get_booking_by_id(booking_id)
         self.assertIsNotNone(booking)
@@ -115,39 +92,26 @@ class PaidSmsIdempotencyTest(unittest.TestCase):
         self.assertIsNone(booking.get("customer_phone_temp"))
 
     def test_customer_sms_retry_on_failure_without_admin_duplicate(self) -> None:
-        status, payload = self._post_json(
-            "/api/hold",
-            {
-                "trailerType": "KAP",
-                "rentalType": "TWO_HOURS",
-                "date": "2026-07-13",
-                "startTime": "11:00",
-                "customerPhone": "+46705556677",
-            },
-        )
-        self.assertEqual(status, 201)
-        booking_id = payload["bookingId"]
+        booking_id = self._retry_booking_id
 
         call_counter = {"admin": 0, "customer": 0}
 
         def flaky_send_sms(to_e164: str, message: str) -> bool:
-            if to_e164 == "+46709663485":
+            if to_e164 == _ADMIN_NUMBER:
                 call_counter["admin"] += 1
                 return True
             call_counter["customer"] += 1
             return call_counter["customer"] > 1
 
-        with mock.patch("sms_provider.get_admin_sms_number_e164", return_value="+46709663485"), mock.patch(
-            "sms_provider.send_sms", side_effect=flaky_send_sms
-        ):
-            first_status, _ = self._post(
-                f"/api/dev/swish/mark?bookingId={booking_id}&status=PAID",
-                auth=True,
-            )
-            second_status, _ = self._post(
-                f"/api/dev/swish/mark?bookingId={booking_id}&status=PAID",
-                auth=True,
-            )
+        self._send_sms.side_effect = flaky_send_sms
+        first_status, _ = self._post(
+            f"/api/dev/swish/mark?bookingId={booking_id}&status=PAID",
+            auth=True,
+        )
+        second_status, _ = self._post(
+            f"/api/dev/swish/mark?bookingId={booking_id}&status=PAID",
+            auth=True,
+        )
 
         self.assertEqual(first_status, 200)
         self.assertEqual(second_status, 200)
@@ -161,18 +125,8 @@ class PaidSmsIdempotencyTest(unittest.TestCase):
         self.assertIsNone(booking.get("customer_phone_temp"))
 
     def test_customer_phone_cleared_when_booking_is_cancelled(self) -> None:
-        status, payload = self._post_json(
-            "/api/hold",
-            {
-                "trailerType": "GALLER",
-                "rentalType": "TWO_HOURS",
-                "date": "2026-07-14",
-                "startTime": "12:00",
-                "customerPhone": "0709998877",
-            },
-        )
-        self.assertEqual(status, 201)
-        booking_id = payload["bookingId"]
+        booking_id = self._cancel_booking_id
+        self.assertIsNotNone(db.get_booking_by_id(booking_id).get("customer_phone_temp"))
 
         fail_status, fail_payload = self._post(
             f"/api/dev/swish/mark?bookingId={booking_id}&status=FAILED",
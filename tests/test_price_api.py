@@ -1,37 +1,12 @@
-import json
-import threading
 import unittest
-from http.server import HTTPServer
-from pathlib import Path
-from tempfile import TemporaryDirectory
 from urllib.parse import urlencode
-from urllib.request import urlopen
 
-import app
-import db
+from _base import ServerTestBase
+from _json_compat import loads
+from _support import HTTP
 
 
-class PriceApiTest(unittest.TestCase):
-    @classmethod
-    def setUpClass(cls) -> None:
-        cls._tmpdir = TemporaryDirectory()
-        cls._original_db_path = db.DB_PATH
-        db.DB_PATH = Path(cls._tmpdir.name) / "test_database.db"
-        db.init_db()
-
-        cls._server = HTTPServer(("127.0.0.1", 0), app.Handler)
-        cls._thread = threading.Thread(target=cls._server.serve_forever, daemon=True)
-        cls._thread.start()
-        cls._base_url = f"http://127.0.0.1:{cls._server.server_port}"
-
-    @classmethod
-    def tearDownClass(cls) -> None:
-        cls._server.shutdown()
-        cls._server.server_close()
-        cls._thread.join(timeout=2)
-        db.DB_PATH = cls._original_db_path
-        cls._tmpdir.cleanup()
-
+class PriceApiTest(ServerTestBase):
     def _get_price(self, trailer_type: str, rental_type: str, date_str: str) -> int:
         query = urlencode(
             {
@@ -40,10 +15,10 @@ class PriceApiTest(unittest.TestCase):
                 "date": date_str,
             }
         )
-        with urlopen(f"{self._base_url}/api/price?{query}") as resp:
-            self.assertEqual(resp.status, 200)
-            payload = json.loads(resp.read().decode("utf-8"))
-            return payload["price"]
+        resp = HTTP.request("GET", f"{self._base_url}/api/price?{query}")
+        self.assertEqual(resp.status, 200)
+        payload = loads(resp.data)
+        return payload["price"]
 
     def test_price_for_all_required_combinations(self) -> None:
         # Monday, February 9, 2026 -> full day weekday price.
@@ -1,38 +1,14 @@
-import json
-import threading
 import unittest
 from datetime import datetime
-from http.server import HTTPServer
-from pathlib import Path
-from tempfile import TemporaryDirectory
 from urllib.parse import urlencode
-from urllib.request import urlopen
 
-import app
 import db
+from _base import ServerTestBase
+from _json_compat import loads
+from _support import HTTP
 
 
-class PriceApiExtendedTest(unittest.TestCase):
-    @classmethod
-    def setUpClass(cls) -> None:
-        cls._tmpdir = TemporaryDirectory()
-        cls._original_db_path = db.DB_PATH
-        db.DB_PATH = Path(cls._tmpdir.name) / "test_database.db"
-        db.init_db()
-
-        cls._server = HTTPServer(("127.0.0.1", 0), app.Handler)
-        cls._thread = threading.Thread(target=cls._server.serve_forever, daemon=True)
-        cls._thread.start()
-        cls._base_url = f"http://127.0.0.1:{cls._server.server_port}"
-
-    @classmethod
-    def tearDownClass(cls) -> None:
-        cls._server.shutdown()
-        cls._server.server_close()
-        cls._thread.join(timeout=2)
-        db.DB_PATH = cls._original_db_path
-        cls._tmpdir.cleanup()
-
+class PriceApiExtendedTest(ServerTestBase):
     def _get_price_payload(self, trailer_type: str, rental_type: str, date_str: str) -> dict:
         query = urlencode(
             {
@@ -41,9 +17,9 @@ class PriceApiExtendedTest(unittest.TestCase):
                 "date": date_str,
             }
         )
-        with urlopen(f"{self._base_url}/api/price?{query}") as resp:
-            self.assertEqual(resp.status, 200)
-            return json.loads(resp.read().decode("utf-8"))
+        resp = HTTP.request("GET", f"{self._base_url}/api/price?{query}")
+        self.assertEqual(resp.status, 200)
+        return loads(resp.data)
 
     def test_calculate_price_weekday_weekend_holiday(self) -> None:
         self.assertEqual(
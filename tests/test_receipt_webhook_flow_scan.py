@@ -1,6 +1,10 @@
 from __future__ import annotations
 
+import hashlib
+import hmac
+import json
 import sqlite3
+import threading
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Any
@@ -11,6 +15,7 @@ import app
 import db
 import notifications
 import sms_provider
+from _support import init_test_db
 
 
 class _DummyHandler:
@@ -26,10 +31,20 @@ class _FakeResponse:
         self.headers = headers or {}
 
 
+# Responses the fakes hand back unchanged; nothing reads or mutates them, so
+# each is built once instead of on every fake post.
+_REDIRECT = _FakeResponse(302, "redirect")
+_OK = _FakeResponse(200, "ok")
+_TEMPORARY_ERROR = _FakeResponse(500, "temporary error")
+_BAD_REQUEST = _FakeResponse(400, "bad request")
+_UNAVAILABLE = _FakeResponse(503, "unavailable", {"Retry-After": "120"})
+_REDIRECT_TO_FINAL = _FakeResponse(302, "redirect", {"Location": "https://example.com/final"})
+
+
 @pytest.fixture()
 def isolated_db(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
     monkeypatch.setattr(db, "DB_PATH", tmp_path / "test_database.db")
-    db.init_db()
+    init_test_db()
 
 
 @pytest.fixture()
@@ -60,10 +75,10 @@ def _create_paid_booking(*, receipt_requested: bool, customer_email: str | None)
 
 
 def _set_booking_reference(booking_id: int, booking_reference: str) -> None:
-    conn = sqlite3.connect(db.DB_PATH)
+    # One statement, so autocommit; no explicit transaction to open and commit.
+    conn = sqlite3.connect(db.DB_PATH, isolation_level=None)
     try:
         conn.execute("UPDATE bookings SET booking_reference = ? WHERE id = ?", (booking_reference, booking_id))
-        conn.commit()
     finally:
         conn.close()
 
@@ -91,21 +106,44 @@ def test_a_paid_requested_with_email_and_env_posts_once_with_expected_payload(
     monkeypatch.setenv("NOTIFY_WEBHOOK_SECRET", "secret-1")
     calls: list[dict[str, Any]] = []
 
-    def _fake_post(url: str, json: dict[str, Any], timeout: int, allow_redirects: bool) -> _FakeResponse:
-        calls.append({"url": url, "json": json, "timeout": timeout, "allow_redirects": allow_redirects})
-        return _FakeResponse(302, "redirect", {"Location": "https://example.com/final"})
-
-    monkeypatch.setattr(notifications.requests, "post", _fake_post)
+    def _fake_post(
+        url: str,
+        data: bytes,
+        headers: dict[str, str],
+        params: dict[str, str] | None,
+        timeout: int,
+        allow_redirects: bool,
+    ) -> _FakeResponse:
+        calls.append(
+            {
+                "url": url,
+                "data": data,
+                "json": json.loads(data),
+                "headers": headers,
+                "params": params,
+                "timeout": timeout,
+                "allow_redirects": allow_redirects,
+            }
+        )
+        return _REDIRECT_TO_FINAL
+
+    monkeypatch.setattr(notifications._SESSION, "post", _fake_post)
 
     booking_id = _create_paid_booking(receipt_requested=True, customer_email="receipt@example.com")
     dummy_handler._send_paid_sms_notifications(booking_id)
+    notifications._flush_webhook_queue()
     dummy_handler._send_paid_sms_notifications(booking_id)
+    notifications._flush_webhook_queue()
 
     assert len(calls) == 1
     call = calls[0]
     assert call["url"] == "https://example.com/webhook"
     assert call["timeout"] == 10
     assert call["allow_redirects"] is False
+    assert call["headers"]["Content-Type"].startswith("application/json")
+    signature = hmac.new(b"secret-1", call["data"], hashlib.sha256).hexdigest()
+    assert call["headers"]["X-Notify-Signature"] == f"sha256={signature}"
+    assert call["params"] == {"signature": signature}
 
     payload = call["json"]
     assert payload["event"] == "booking.confirmed"
@@ -114,36 +152,25 @@ def test_a_paid_requested_with_email_and_env_posts_once_with_expected_payload(
     assert payload["receiptRequested"] is True
     assert payload["customerEmail"] == "receipt@example.com"
     assert payload["swishStatus"] == "PAID"
-    assert payload["secret"] == "secret-1"
-
-
-def test_b_receipt_not_requested_never_posts(
-    isolated_db: None,
-    dummy_handler: _DummyHandler,
-    disable_sms: None,
-    monkeypatch: pytest.MonkeyPatch,
-) -> None:
-    monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
-    called = False
-
-    def _fake_post(*_args: Any, **_kwargs: Any) -> _FakeResponse:
-        nonlocal called
-        called = True
-        return _FakeResponse(302, "redirect")
-
-    monkeypatch.setattr(notifications.requests, "post", _fake_post)
-
-    booking_id = _create_paid_booking(receipt_requested=False, customer_email="receipt@example.com")
-    dummy_handler._send_paid_sms_notifications(booking_id)
-
-    assert called is False
-
-
-def test_c_email_missing_never_posts(
+    assert "secret" not in payload
+
+
+@pytest.mark.parametrize(
+    ("receipt_requested", "customer_email", "booking_reference"),
+    [
+        pytest.param(False, "receipt@example.com", None, id="receipt_not_requested"),
+        pytest.param(True, None, None, id="email_missing"),
+        pytest.param(True, "receipt@example.com", "TEST-20260221-000001", id="test_booking_reference"),
+    ],
+)
+def test_b_ineligible_booking_never_posts(
     isolated_db: None,
     dummy_handler: _DummyHandler,
     disable_sms: None,
     monkeypatch: pytest.MonkeyPatch,
+    receipt_requested: bool,
+    customer_email: str | None,
+    booking_reference: str | None,
 ) -> None:
     monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
     called = False
@@ -151,12 +178,15 @@ def test_c_email_missing_never_posts(
     def _fake_post(*_args: Any, **_kwargs: Any) -> _FakeResponse:
         nonlocal called
         called = True
-        return _FakeResponse(302, "redirect")
+        return _REDIRECT
 
-    monkeypatch.setattr(notifications.requests, "post", _fake_post)
+    monkeypatch.setattr(notifications._SESSION, "post", _fake_post)
 
-    booking_id = _create_paid_booking(receipt_requested=True, customer_email=None)
+    booking_id = _create_paid_booking(receipt_requested=receipt_requested, customer_email=customer_email)
+    if booking_reference is not None:
+        _set_booking_reference(booking_id, booking_reference)
     dummy_handler._send_paid_sms_notifications(booking_id)
+    notifications._flush_webhook_queue()
 
     assert called is False
 
@@ -168,9 +198,9 @@ def test_d_missing_notify_webhook_url_returns_false_and_logs(
     monkeypatch.delenv("NOTIFY_WEBHOOK_URL", raising=False)
 
     def _fail_if_called(*_args: Any, **_kwargs: Any) -> _FakeResponse:
-        raise AssertionError("requests.post must not be called")
+        raise AssertionError("webhook POST must not be called")
 
-    monkeypatch.setattr(notifications.requests, "post", _fail_if_called)
+    monkeypatch.setattr(notifications._SESSION, "post", _fail_if_called)
     caplog.set_level("INFO")
 
     ok = notifications.send_receipt_webhook(_booking_payload())
@@ -179,158 +209,377 @@ def test_d_missing_notify_webhook_url_returns_false_and_logs(
     assert "WEBHOOK_DISABLED" in caplog.text
 
 
-def test_e_webhook_303_is_ok(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.parametrize(
+    "response",
+    [
+        pytest.param(_FakeResponse(303, "redirect"), id="303"),
+        pytest.param(_FakeResponse(200, "All OK"), id="200_ok_body"),
+        pytest.param(_FakeResponse(200, "accepted"), id="200_other_body"),
+        pytest.param(_FakeResponse(200, '{"success": true}'), id="200_json_success"),
+        pytest.param(_FakeResponse(204, ""), id="204"),
+        pytest.param(_FakeResponse(200, '{"ok": true}'), id="200_json_ok"),
+    ],
+)
+def test_e_webhook_success_response_is_ok(monkeypatch: pytest.MonkeyPatch, response: _FakeResponse) -> None:
     monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
-    monkeypatch.setattr(notifications.requests, "post", lambda *_a, **_k: _FakeResponse(303, "redirect"))
+    monkeypatch.setattr(notifications._SESSION, "post", lambda *_a, **_k: response)
 
     assert notifications.send_receipt_webhook(_booking_payload()) is True
 
 
-def test_f_webhook_200_with_ok_body_is_ok(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_h_webhook_exception_returns_false_without_crash(monkeypatch: pytest.MonkeyPatch) -> None:
     monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
-    monkeypatch.setattr(notifications.requests, "post", lambda *_a, **_k: _FakeResponse(200, "All OK"))
 
-    assert notifications.send_receipt_webhook(_booking_payload()) is True
+    def _raise_timeout(*_args: Any, **_kwargs: Any) -> _FakeResponse:
+        raise notifications.requests.Timeout("timeout")
+
+    monkeypatch.setattr(notifications._SESSION, "post", _raise_timeout)
+
+    assert notifications.send_receipt_webhook(_booking_payload()) is False
 
 
-def test_g_webhook_200_without_ok_body_is_ok(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_m_retry_timeout_and_5xx_then_success(monkeypatch: pytest.MonkeyPatch) -> None:
     monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
-    monkeypatch.setattr(notifications.requests, "post", lambda *_a, **_k: _FakeResponse(200, "accepted"))
+    calls = {"count": 0}
+    sleeps: list[float] = []
+
+    def _fake_post(*_args: Any, **_kwargs: Any) -> _FakeResponse:
+        calls["count"] += 1
+        if calls["count"] == 1:
+            raise notifications.requests.Timeout("timeout")
+        if calls["count"] == 2:
+            return _TEMPORARY_ERROR
+        return _OK
+
+    monkeypatch.setattr(notifications._SESSION, "post", _fake_post)
+    monkeypatch.setattr(notifications.time, "sleep", lambda seconds: sleeps.append(seconds))
+    # Take the top of each jitter range so the schedule is deterministic.
+    monkeypatch.setattr(notifications.random, "uniform", lambda _low, high: high)
 
     assert notifications.send_receipt_webhook(_booking_payload()) is True
+    assert calls["count"] == 3
+    assert sleeps == [0.5, 1.0]
 
 
-def test_h_webhook_exception_returns_false_without_crash(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_n_no_retry_on_4xx(monkeypatch: pytest.MonkeyPatch) -> None:
     monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
+    calls = {"count": 0}
+    sleeps: list[float] = []
 
-    def _raise_timeout(*_args: Any, **_kwargs: Any) -> _FakeResponse:
-        raise notifications.requests.Timeout("timeout")
+    def _fake_post(*_args: Any, **_kwargs: Any) -> _FakeResponse:
+        calls["count"] += 1
+        return _BAD_REQUEST
 
-    monkeypatch.setattr(notifications.requests, "post", _raise_timeout)
+    monkeypatch.setattr(notifications._SESSION, "post", _fake_post)
+    monkeypatch.setattr(notifications.time, "sleep", lambda seconds: sleeps.append(seconds))
 
     assert notifications.send_receipt_webhook(_booking_payload()) is False
+    assert calls["count"] == 1
+    assert sleeps == []
 
 
-def test_i_test_booking_reference_skips_receipt_webhook(
+def test_o_idempotency_fail_does_not_block_next_trigger(
     isolated_db: None,
     dummy_handler: _DummyHandler,
     disable_sms: None,
     monkeypatch: pytest.MonkeyPatch,
 ) -> None:
     monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
-    called = False
+    calls = {"count": 0}
 
     def _fake_post(*_args: Any, **_kwargs: Any) -> _FakeResponse:
-        nonlocal called
-        called = True
-        return _FakeResponse(302, "redirect")
+        calls["count"] += 1
+        if calls["count"] <= 3:
+            return _TEMPORARY_ERROR
+        return _OK
 
-    monkeypatch.setattr(notifications.requests, "post", _fake_post)
+    monkeypatch.setattr(notifications._SESSION, "post", _fake_post)
+    monkeypatch.setattr(notifications.time, "sleep", lambda _seconds: None)
 
     booking_id = _create_paid_booking(receipt_requested=True, customer_email="receipt@example.com")
-    _set_booking_reference(booking_id, "TEST-20260221-000001")
-
     dummy_handler._send_paid_sms_notifications(booking_id)
+    notifications._flush_webhook_queue()
+    failure = db.get_webhook_failure(booking_id)
+    assert failure is not None
+    assert failure["last_status"] == 500
+    dummy_handler._send_paid_sms_notifications(booking_id)
+    notifications._flush_webhook_queue()
 
-    assert called is False
+    assert calls["count"] == 4
+    assert db.get_webhook_failure(booking_id) is None
+    booking = db.get_booking_by_id(booking_id)
+    assert booking is not None
+    assert booking.get("receipt_webhook_sent_at") is not None
+    assert booking.get("receipt_webhook_lock_at") is None
 
 
-def test_j_webhook_200_with_json_success_true_is_ok(monkeypatch: pytest.MonkeyPatch) -> None:
-    monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
-    monkeypatch.setattr(notifications.requests, "post", lambda *_a, **_k: _FakeResponse(200, '{"success": true}'))
+def test_p_claim_receipt_webhook_send_allows_only_one_inflight(isolated_db: None) -> None:
+    booking_id = _create_paid_booking(receipt_requested=True, customer_email="receipt@example.com")
+    lock_at = "2026-07-01T12:00:00"
 
-    assert notifications.send_receipt_webhook(_booking_payload()) is True
+    first = db.claim_receipt_webhook_send(booking_id, lock_at=lock_at)
+    second = db.claim_receipt_webhook_send(booking_id)
 
+    assert first is True
+    assert second is False
 
-def test_k_webhook_204_is_ok(monkeypatch: pytest.MonkeyPatch) -> None:
-    monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
-    monkeypatch.setattr(notifications.requests, "post", lambda *_a, **_k: _FakeResponse(204, ""))
+    assert db.release_receipt_webhook_lock(booking_id, lock_at) is True
+    assert db.claim_receipt_webhook_send(booking_id) is True
 
-    assert notifications.send_receipt_webhook(_booking_payload()) is True
 
+def test_p2_stale_receipt_webhook_claim_can_be_taken_over(isolated_db: None) -> None:
+    booking_id = _create_paid_booking(receipt_requested=True, customer_email="receipt@example.com")
+    locked_at = datetime(2026, 7, 1, 12, 0)
+
+    assert db.claim_receipt_webhook_send(booking_id, lock_at=locked_at.isoformat(timespec="seconds")) is True
+    fresh = locked_at + timedelta(minutes=db.RECEIPT_WEBHOOK_LOCK_TIMEOUT_MINUTES)
+    assert db.claim_receipt_webhook_send(booking_id, lock_at=fresh.isoformat(timespec="seconds")) is False
+    stale = fresh + timedelta(seconds=1)
+    assert db.claim_receipt_webhook_send(booking_id, lock_at=stale.isoformat(timespec="seconds")) is True
+
+    # The superseded claim can neither finalize nor drop the new one.
+    old_lock = locked_at.isoformat(timespec="seconds")
+    assert db.holds_receipt_webhook_lock(booking_id, old_lock) is False
+    assert db.finalize_receipt_webhook_send(booking_id, old_lock) is False
+    assert db.release_receipt_webhook_lock(booking_id, old_lock) is False
+    booking = db.get_booking_by_id(booking_id)
+    assert booking is not None
+    assert booking.get("receipt_webhook_lock_at") == stale.isoformat(timespec="seconds")
+    assert booking.get("receipt_webhook_sent_at") is None
 
-def test_l_webhook_200_with_json_ok_true_is_ok(monkeypatch: pytest.MonkeyPatch) -> None:
-    monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
-    monkeypatch.setattr(notifications.requests, "post", lambda *_a, **_k: _FakeResponse(200, '{"ok": true}'))
 
-    assert notifications.send_receipt_webhook(_booking_payload()) is True
+def test_q_finalize_receipt_webhook_send_requires_claim_and_clears_temp_fields(isolated_db: None) -> None:
+    booking_id = _create_paid_booking(receipt_requested=True, customer_email="receipt@example.com")
+    lock_at = "2026-07-01T12:00:00"
 
+    assert db.finalize_receipt_webhook_send(booking_id, lock_at) is False
 
-def test_m_retry_timeout_and_5xx_then_success(monkeypatch: pytest.MonkeyPatch) -> None:
+    assert db.claim_receipt_webhook_send(booking_id, lock_at=lock_at) is True
+    assert db.finalize_receipt_webhook_send(booking_id, lock_at) is True
+    assert db.finalize_receipt_webhook_send(booking_id, lock_at) is False
+
+    booking = db.get_booking_by_id(booking_id)
+    assert booking is not None
+    assert booking.get("receipt_webhook_sent_at") is not None
+    assert booking.get("receipt_webhook_lock_at") is None
+    assert booking.get("customer_email_temp") is None
+    assert booking.get("receipt_requested_temp") == 0
+
+
+@pytest.mark.parametrize(
+    ("body", "expected"),
+    [
+        ("", False),
+        ("accepted", False),
+        ("All OK", True),
+        ('{"ok": true}', True),
+        ('{"success": true}', True),
+        ('{"success": false}', False),
+        ("{not json success", False),
+    ],
+)
+def test_r_response_declares_ok(body: str, expected: bool) -> None:
+    assert notifications._response_declares_ok(body) is expected
+
+
+def test_s_no_retry_on_5xx_with_retry_after(monkeypatch: pytest.MonkeyPatch) -> None:
     monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
     calls = {"count": 0}
     sleeps: list[float] = []
 
     def _fake_post(*_args: Any, **_kwargs: Any) -> _FakeResponse:
         calls["count"] += 1
-        if calls["count"] == 1:
-            raise notifications.requests.Timeout("timeout")
-        if calls["count"] == 2:
-            return _FakeResponse(500, "temporary error")
-        return _FakeResponse(200, "ok")
+        return _UNAVAILABLE
 
-    monkeypatch.setattr(notifications.requests, "post", _fake_post)
+    monkeypatch.setattr(notifications._SESSION, "post", _fake_post)
     monkeypatch.setattr(notifications.time, "sleep", lambda seconds: sleeps.append(seconds))
 
-    assert notifications.send_receipt_webhook(_booking_payload()) is True
-    assert calls["count"] == 3
-    assert sleeps == [0.5, 1.0]
+    assert notifications.send_receipt_webhook(_booking_payload()) is False
+    assert calls["count"] == 1
+    assert sleeps == []
 
 
-def test_n_no_retry_on_4xx(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_t_retry_delay_is_jittered_and_capped() -> None:
+    for attempt, bound in ((1, 0.5), (2, 1.0), (3, 2.0), (4, 4.0), (10, 4.0)):
+        for _ in range(20):
+            assert 0 <= notifications._retry_delay(attempt) <= bound
+
+
+def test_u_receipt_webhook_is_sent_from_the_worker_thread(
+    isolated_db: None,
+    dummy_handler: _DummyHandler,
+    disable_sms: None,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
     monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
-    calls = {"count": 0}
-    sleeps: list[float] = []
+    threads: list[str] = []
 
     def _fake_post(*_args: Any, **_kwargs: Any) -> _FakeResponse:
-        calls["count"] += 1
-        return _FakeResponse(400, "bad request")
+        threads.append(threading.current_thread().name)
+        return _OK
 
-    monkeypatch.setattr(notifications.requests, "post", _fake_post)
-    monkeypatch.setattr(notifications.time, "sleep", lambda seconds: sleeps.append(seconds))
+    monkeypatch.setattr(notifications._SESSION, "post", _fake_post)
 
-    assert notifications.send_receipt_webhook(_booking_payload()) is False
-    assert calls["count"] == 1
-    assert sleeps == []
+    booking_id = _create_paid_booking(receipt_requested=True, customer_email="receipt@example.com")
+    dummy_handler._send_paid_sms_notifications(booking_id)
+    notifications._flush_webhook_queue()
 
+    assert threads == ["webhook-worker"]
+    booking = db.get_booking_by_id(booking_id)
+    assert booking is not None
+    assert booking.get("receipt_webhook_sent_at") is not None
 
-def test_o_idempotency_fail_does_not_block_next_trigger(
+
+def test_v_terminal_webhook_failure_is_kept_for_replay(
     isolated_db: None,
     dummy_handler: _DummyHandler,
     disable_sms: None,
     monkeypatch: pytest.MonkeyPatch,
 ) -> None:
     monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
-    calls = {"count": 0}
+    monkeypatch.setenv("NOTIFY_WEBHOOK_SECRET", "secret-1")
+    monkeypatch.setattr(notifications._SESSION, "post", lambda *_a, **_k: _BAD_REQUEST)
 
-    def _fake_post(*_args: Any, **_kwargs: Any) -> _FakeResponse:
-        calls["count"] += 1
-        if calls["count"] <= 3:
-            return _FakeResponse(500, "temporary error")
-        return _FakeResponse(200, "ok")
+    booking_id = _create_paid_booking(receipt_requested=True, customer_email="receipt@example.com")
+    dummy_handler._send_paid_sms_notifications(booking_id)
+    notifications._flush_webhook_queue()
+
+    failure = db.get_webhook_failure(booking_id)
+    assert failure is not None
+    assert failure["attempts"] == 1
+    assert failure["last_status"] == 400
+    assert failure["last_error"] == "bad request"
+    payload = json.loads(failure["payload_json"])
+    assert payload["bookingReference"]
+    assert "customerEmail" not in payload
+    assert "secret" not in payload
 
-    monkeypatch.setattr(notifications.requests, "post", _fake_post)
-    monkeypatch.setattr(notifications.time, "sleep", lambda _seconds: None)
+    booking = db.get_booking_by_id(booking_id)
+    assert booking is not None
+    assert booking.get("receipt_webhook_sent_at") is None
+    assert booking.get("receipt_webhook_lock_at") is None
 
-    booking_id = _create_paid_booking(receipt_requested=True, customer_email="receipt@example.com")
+    # Another failed pass updates the same row instead of adding one.
     dummy_handler._send_paid_sms_notifications(booking_id)
+    notifications._flush_webhook_queue()
+    failure = db.get_webhook_failure(booking_id)
+    assert failure is not None
+    assert failure["attempts"] == 2
+
+    db.cancel_booking(booking_id)
+    assert db.get_webhook_failure(booking_id) is None
+
+
+def test_w_unsigned_without_webhook_secret(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
+    monkeypatch.delenv("WEBHOOK_SECRET", raising=False)
+    monkeypatch.delenv("NOTIFY_WEBHOOK_SECRET", raising=False)
+    calls: list[dict[str, Any]] = []
+
+    def _fake_post(*_args: Any, **kwargs: Any) -> _FakeResponse:
+        calls.append(kwargs)
+        return _OK
+
+    monkeypatch.setattr(notifications._SESSION, "post", _fake_post)
+
+    assert notifications.send_receipt_webhook(_booking_payload()) is True
+    assert "X-Notify-Signature" not in calls[0]["headers"]
+    assert calls[0]["params"] is None
+
+
+def test_x_expiring_a_booking_deletes_its_webhook_failure(isolated_db: None) -> None:
+    start_dt = datetime(2026, 7, 1, 10, 0)
+    booking_id, _ = db.create_booking("KAP", "TWO_HOURS", start_dt, start_dt + timedelta(hours=2))
+    db.record_webhook_failure(booking_id, "{}", 500, "temporary error")
+
+    assert db.expire_outdated_bookings(now=datetime(2100, 1, 1)) == 1
+    assert db.get_webhook_failure(booking_id) is None
+
+
+def test_y_claim_is_released_when_recording_the_failure_raises(
+    isolated_db: None,
+    dummy_handler: _DummyHandler,
+    disable_sms: None,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
+    monkeypatch.setattr(notifications._SESSION, "post", lambda *_a, **_k: _BAD_REQUEST)
+
+    def _raise(*_args: Any, **_kwargs: Any) -> int:
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(db, "record_webhook_failure", _raise)
+
+    booking_id = _create_paid_booking(receipt_requested=True, customer_email="receipt@example.com")
     dummy_handler._send_paid_sms_notifications(booking_id)
+    notifications._flush_webhook_queue()
 
-    assert calls["count"] == 4
     booking = db.get_booking_by_id(booking_id)
     assert booking is not None
-    assert booking.get("receipt_webhook_sent_at") is not None
     assert booking.get("receipt_webhook_lock_at") is None
 
 
-def test_p_claim_receipt_webhook_send_allows_only_one_inflight(isolated_db: None) -> None:
+def test_z_drain_webhook_queue_waits_for_queued_jobs() -> None:
+    release = threading.Event()
+    notifications.submit_webhook(release.wait)
+
+    assert notifications.drain_webhook_queue(0.05) is False
+    release.set()
+    assert notifications.drain_webhook_queue(5) is True
+
+
+def test_z2_queued_job_skips_when_its_claim_was_taken_over(
+    isolated_db: None,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
+    calls: list[bytes] = []
+
+    def _fake_post(*_args: Any, **kwargs: Any) -> _FakeResponse:
+        calls.append(kwargs["data"])
+        return _OK
+
+    monkeypatch.setattr(notifications._SESSION, "post", _fake_post)
+
     booking_id = _create_paid_booking(receipt_requested=True, customer_email="receipt@example.com")
+    booking = db.get_booking_by_id(booking_id)
+    assert booking is not None
+    old_lock = "2026-07-01T12:00:00"
+    new_lock = "2026-07-01T12:30:00"
+    assert db.claim_receipt_webhook_send(booking_id, lock_at=old_lock) is True
+    assert db.claim_receipt_webhook_send(booking_id, lock_at=new_lock) is True
+
+    app._deliver_receipt_webhook(booking_id, booking, old_lock)
+    assert calls == []
+    booking_after = db.get_booking_by_id(booking_id)
+    assert booking_after is not None
+    assert booking_after.get("receipt_webhook_lock_at") == new_lock
+
+    app._deliver_receipt_webhook(booking_id, booking, new_lock)
+    assert len(calls) == 1
+    booking_after = db.get_booking_by_id(booking_id)
+    assert booking_after is not None
+    assert booking_after.get("receipt_webhook_sent_at") is not None
 
-    first = db.claim_receipt_webhook_send(booking_id)
-    second = db.claim_receipt_webhook_send(booking_id)
 
-    assert first is True
-    assert second is False
+def test_z3_webhook_send_log_masks_email_only_when_info_is_enabled(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    monkeypatch.setenv("NOTIFY_WEBHOOK_URL", "https://example.com/webhook")
+    monkeypatch.setattr(notifications._SESSION, "post", lambda *_a, **_k: _OK)
+    masked: list[str] = []
 
-    assert db.release_receipt_webhook_lock(booking_id) is True
-    assert db.claim_receipt_webhook_send(booking_id) is True
+    def _mask(email: str) -> str:
+        masked.append(email)
+        return "r***@example.com"
+
+    monkeypatch.setattr(notifications, "mask_email", _mask)
+
+    with caplog.at_level("WARNING", logger="notifications"):
+        assert notifications.send_receipt_webhook(_booking_payload()) is True
+    assert masked == []
+
+    with caplog.at_level("INFO", logger="notifications"):
+        assert notifications.send_receipt_webhook(_booking_payload()) is True
+    assert len(masked) == 1
+    assert "customerEmail=r***@example.com" in caplog.text
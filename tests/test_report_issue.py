@@ -1,73 +1,49 @@
+import io
+import json
 import os
-import threading
 import unittest
 import uuid
-from http.server import ThreadingHTTPServer
-from pathlib import Path
-from tempfile import TemporaryDirectory
+from collections.abc import Iterator
 from unittest import mock
-from urllib.error import HTTPError
-from urllib.request import Request, urlopen
 
 import app
-import db
+from _base import ServerTestBase
+from _support import HTTP
 
 
-def _build_multipart(fields: dict[str, str], files: list[tuple[str, str, str, bytes]]) -> tuple[bytes, str]:
-    boundary = "----dhsreportboundary"
-    chunks: list[bytes] = []
+_BOUNDARY = b"----dhsreportboundary"
+_PART_START = b"--" + _BOUNDARY + b"\r\n"
+_PARTS_END = b"--" + _BOUNDARY + b"--\r\n"
+_CRLF = b"\r\n"
+_FIELD_HEADER = b'Content-Disposition: form-data; name="%s"\r\n\r\n'
+_FILE_HEADER = b'Content-Disposition: form-data; name="%s"; filename="%s"\r\nContent-Type: %s\r\n\r\n'
+_CONTENT_TYPE = "multipart/form-data; boundary=" + _BOUNDARY.decode("ascii")
+
+
+def _iter_multipart_parts(fields: dict[str, str], files: list[tuple[str, str, str, bytes]]) -> Iterator[bytes]:
     for key, value in fields.items():
-        chunks.append(f"--{boundary}\r\n".encode("utf-8"))
-        chunks.append(f'Content-Disposition: form-data; name="{key}"\r\n\r\n'.encode("utf-8"))
-        chunks.append(value.encode("utf-8"))
-        chunks.append(b"\r\n")
+        yield _PART_START
+        yield _FIELD_HEADER % key.encode("utf-8")
+        yield value.encode("utf-8")
+        yield _CRLF
     for field_name, filename, content_type, payload in files:
-        chunks.append(f"--{boundary}\r\n".encode("utf-8"))
-        chunks.append(
-            (
-                f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
-                f"Content-Type: {content_type}\r\n\r\n"
-            ).encode("utf-8")
-        )
-        chunks.append(payload)
-        chunks.append(b"\r\n")
-    chunks.append(f"--{boundary}--\r\n".encode("utf-8"))
-    return b"".join(chunks), f"multipart/form-data; boundary={boundary}"
-
-
-class ReportIssueTest(unittest.TestCase):
-    @classmethod
-    def setUpClass(cls) -> None:
-        cls._tmpdir = TemporaryDirectory()
-        cls._original_db_path = db.DB_PATH
-        db.DB_PATH = Path(cls._tmpdir.name) / "test_database.db"
-        db.init_db()
-
-        cls._server = ThreadingHTTPServer(("127.0.0.1", 0), app.Handler)
-        cls._thread = threading.Thread(target=cls._server.serve_forever, daemon=True)
-        cls._thread.start()
-        cls._base_url = f"http://127.0.0.1:{cls._server.server_port}"
-
-    @classmethod
-    def tearDownClass(cls) -> None:
-        cls._server.shutdown()
-        cls._server.server_close()
-        cls._thread.join(timeout=2)
-        db.DB_PATH = cls._original_db_path
-        cls._tmpdir.cleanup()
+        yield _PART_START
+        yield _FILE_HEADER % (field_name.encode("utf-8"), filename.encode("utf-8"), content_type.encode("utf-8"))
+        yield payload
+        yield _CRLF
+    yield _PARTS_END
+
 
+def _build_multipart(fields: dict[str, str], files: list[tuple[str, str, str, bytes]]) -> tuple[bytes, str]:
+    buf = io.BytesIO()
+    buf.writelines(_iter_multipart_parts(fields, files))
+    return buf.getvalue(), _CONTENT_TYPE
+
+
+class ReportIssueTest(ServerTestBase):
     def _request(self, method: str, path: str, *, data: bytes = b"", headers: dict[str, str] | None = None) -> tuple[int, str]:
-        req = Request(
-            f"{self._base_url}{path}",
-            data=data,
-            method=method,
-            headers=headers or {},
-        )
-        try:
-            with urlopen(req) as response:
-                return response.status, response.read().decode("utf-8")
-        except HTTPError as err:
-            return err.code, err.read().decode("utf-8")
+        response = HTTP.request(method, f"{self._base_url}{path}", body=data, headers=headers or {})
+        return response.status, response.data.decode("utf-8")
 
     def test_parse_form_data_multipart_extracts_fields_and_file(self) -> None:
         body, content_type = _build_multipart(
@@ -84,6 +60,32 @@ class ReportIssueTest(unittest.TestCase):
         self.assertEqual(files[0]["content_type"], "image/png")
         self.assertEqual(files[0]["data_bytes"], b"\x89PNG\r\n\x1a\n")
 
+    def test_parse_form_data_multipart_keeps_binary_file_bytes_intact(self) -> None:
+        image = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) + b"\r\n--not-the-boundary\r\n\r\n" + b"\x00" * 64
+        body, content_type = _build_multipart(
+            {"name": "Bo", "message": "rad 1\r\nrad 2"},
+            [("images", "a.png", "image/png", image), ("images", "b.png", "image/png", b"")],
+        )
+        fields, files = app.parse_form_data(content_type, body)
+
+        self.assertEqual(fields, {"name": "Bo", "message": "rad 1\r\nrad 2"})
+        self.assertEqual([item["filename"] for item in files], ["a.png", "b.png"])
+        self.assertEqual(files[0]["data_bytes"], image)
+        self.assertEqual(files[0]["size"], len(image))
+        self.assertEqual(files[1]["data_bytes"], b"")
+
+    def test_parse_form_data_multipart_accepts_bare_lf_line_endings(self) -> None:
+        body, content_type = _build_multipart(
+            {"name": "Alice", "message": "Hej"},
+            [("images", "damage.png", "image/png", b"PNGDATA")],
+        )
+        fields, files = app.parse_form_data(content_type, body.replace(b"\r\n", b"\n"))
+
+        self.assertEqual(fields, {"name": "Alice", "message": "Hej"})
+        self.assertEqual(len(files), 1)
+        self.assertEqual(files[0]["filename"], "damage.png")
+        self.assertEqual(files[0]["data_bytes"], b"PNGDATA")
+
     def test_parse_form_data_urlencoded_extracts_fields(self) -> None:
         body = b"name=Alice+Andersson&message=Hej+igen&website="
         fields, files = app.parse_form_data("application/x-www-form-urlencoded", body)
@@ -130,7 +132,8 @@ class ReportIssueTest(unittest.TestCase):
                 self.assertEqual(status, 200)
                 self.assertIn("Rapport mottagen. Vi återkommer.", response_text)
                 post_mock.assert_called_once()
-                payload = post_mock.call_args.kwargs["json"]
+                self.assertTrue(post_mock.call_args.kwargs["headers"]["Content-Type"].startswith("application/json"))
+                payload = json.loads(post_mock.call_args.kwargs["data"])
                 self.assertEqual(payload["type"], "issue_report")
                 self.assertEqual(payload["secret"], "issue-secret")
                 self.assertEqual(payload["to"], "svenningsson@outlook.com")
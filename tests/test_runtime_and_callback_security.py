@@ -1,16 +1,12 @@
 from __future__ import annotations
 
-import http.client
-import json
-import os
-import threading
 from datetime import datetime, timedelta
-from http.server import ThreadingHTTPServer
 from pathlib import Path
-from tempfile import TemporaryDirectory
 
-import app
+import _inproc
 import db
+from _json_compat import dumps, loads
+from _support import init_test_db, tmp_dir
 from config import runtime
 
 
@@ -43,73 +39,46 @@ def test_runtime_legacy_aliases(monkeypatch):
 
 
 def test_callback_requires_secret_in_non_mock_mode(monkeypatch):
-    with TemporaryDirectory() as tmpdir:
-        original_db_path = db.DB_PATH
-        original_swish_mode = os.environ.get("SWISH_MODE")
-        original_webhook_secret = os.environ.get("WEBHOOK_SECRET")
-
-        try:
-            db.DB_PATH = Path(tmpdir) / "test_database.db"
-            db.init_db()
-
-            monkeypatch.setenv("SWISH_MODE", "production")
-            monkeypatch.setenv("WEBHOOK_SECRET", "callback-secret")
-
-            start_dt = (datetime.now() + timedelta(days=2)).replace(hour=9, minute=0, second=0, microsecond=0)
-            end_dt = start_dt + timedelta(hours=2)
-            booking_id, _ = db.create_booking("GALLER", "TWO_HOURS", start_dt, end_dt)
-
-            server = ThreadingHTTPServer(("127.0.0.1", 0), app.Handler)
-            thread = threading.Thread(target=server.serve_forever, daemon=True)
-            thread.start()
-
-            try:
-                conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
-                conn.request(
-                    "POST",
-                    "/api/swish/callback",
-                    body=json.dumps({"paymentReference": booking_id, "status": "PAID"}).encode("utf-8"),
-                    headers={"Content-Type": "application/json"},
-                )
-                resp = conn.getresponse()
-                payload = json.loads(resp.read().decode("utf-8"))
-                conn.close()
-
-                assert resp.status == 401
-                assert payload.get("errorInfo", {}).get("code") == "unauthorized"
-
-                conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
-                conn.request(
-                    "POST",
-                    "/api/swish/callback",
-                    body=json.dumps({"paymentReference": booking_id, "status": "PAID"}).encode("utf-8"),
-                    headers={
-                        "Content-Type": "application/json",
-                        "X-Webhook-Secret": "callback-secret",
-                    },
-                )
-                resp2 = conn.getresponse()
-                payload2 = json.loads(resp2.read().decode("utf-8"))
-                conn.close()
-
-                assert resp2.status == 200
-                assert payload2.get("swishStatus") == "PAID"
-
-                booking = db.get_booking_by_id(booking_id)
-                assert booking
-                assert booking.get("status") == "CONFIRMED"
-                assert booking.get("swish_status") == "PAID"
-            finally:
-                server.shutdown()
-                server.server_close()
-                thread.join(timeout=2)
-        finally:
-            db.DB_PATH = original_db_path
-            if original_swish_mode is None:
-                os.environ.pop("SWISH_MODE", None)
-            else:
-                os.environ["SWISH_MODE"] = original_swish_mode
-            if original_webhook_secret is None:
-                os.environ.pop("WEBHOOK_SECRET", None)
-            else:
-                os.environ["WEBHOOK_SECRET"] = original_webhook_secret
+    with tmp_dir() as tmpdir:
+        # monkeypatch restores DB_PATH and the environment, so the test leaves
+        # no module state behind for whatever runs next in this process.
+        monkeypatch.setattr(db, "DB_PATH", Path(tmpdir) / "test_database.db")
+        init_test_db()
+
+        monkeypatch.setenv("SWISH_MODE", "production")
+        monkeypatch.setenv("WEBHOOK_SECRET", "callback-secret")
+
+        start_dt = (datetime.now() + timedelta(days=2)).replace(hour=9, minute=0, second=0, microsecond=0)
+        end_dt = start_dt + timedelta(hours=2)
+        booking_id, _ = db.create_booking("GALLER", "TWO_HOURS", start_dt, end_dt)
+
+        callback_body = dumps({"paymentReference": booking_id, "status": "PAID"})
+        status, _headers, raw = _inproc.call(
+            "POST",
+            "/api/swish/callback",
+            callback_body,
+            {"Content-Type": "application/json"},
+        )
+        payload = loads(raw)
+
+        assert status == 401
+        assert payload.get("errorInfo", {}).get("code") == "unauthorized"
+
+        status2, _headers2, raw2 = _inproc.call(
+            "POST",
+            "/api/swish/callback",
+            callback_body,
+            {
+                "Content-Type": "application/json",
+                "X-Webhook-Secret": "callback-secret",
+            },
+        )
+        payload2 = loads(raw2)
+
+        assert status2 == 200
+        assert payload2.get("swishStatus") == "PAID"
+
+        booking = db.get_booking_by_id(booking_id)
+        assert booking
+        assert booking.get("status") == "CONFIRMED"
+        assert booking.get("swish_status") == "PAID"
@@ -1,65 +1,85 @@
+from __future__ import annotations
+
+import importlib.util
 import os
-import runpy
-import unittest
-from pathlib import Path
 from unittest import mock
 
+import pytest
+
 import sms_provider
 
 
-class SmsProviderTest(unittest.TestCase):
-    def setUp(self) -> None:
-        sms_provider._twilio_disabled_logged = False
-
-    def test_module_import_has_no_network_side_effects(self) -> None:
-        module_path = Path(__file__).resolve().parents[1] / "sms_provider.py"
-        with mock.patch("urllib.request.urlopen", side_effect=AssertionError("network call on import")):
-            runpy.run_path(str(module_path), run_name="__sms_provider_import_check__")
-
-    def test_send_sms_missing_env_returns_false_without_network(self) -> None:
-        with mock.patch.dict(
-            os.environ,
-            {
-                "TWILIO_ACCOUNT_SID": "",
-                "TWILIO_AUTH_TOKEN": "",
-                "TWILIO_FROM_NUMBER": "",
-            },
-            clear=False,
-        ):
-            with mock.patch("sms_provider.urllib.request.urlopen") as mocked_urlopen:
-                with self.assertLogs("sms_provider", level="WARNING") as logs:
-                    ok = sms_provider.send_sms("+46701234567", "test")
-        self.assertFalse(ok)
-        mocked_urlopen.assert_not_called()
-        self.assertTrue(any("missing Twilio env vars" in line for line in logs.output))
-
-    def test_send_sms_missing_env_logs_only_once_across_multiple_calls(self) -> None:
-        with mock.patch.dict(
-            os.environ,
-            {
-                "TWILIO_ACCOUNT_SID": "",
-                "TWILIO_AUTH_TOKEN": "",
-                "TWILIO_FROM_NUMBER": "",
-            },
-            clear=False,
-        ):
-            with mock.patch("sms_provider.urllib.request.urlopen") as mocked_urlopen:
-                with self.assertLogs("sms_provider", level="WARNING") as logs:
-                    first = sms_provider.send_sms("+46701234567", "test1")
-                    second = sms_provider.send_sms("+46701234567", "test2")
-                    third = sms_provider.send_sms("+46701234567", "test3")
-        self.assertFalse(first)
-        self.assertFalse(second)
-        self.assertFalse(third)
-        mocked_urlopen.assert_not_called()
-        self.assertEqual(sum("missing Twilio env vars" in line for line in logs.output), 1)
-
-    def test_normalize_swedish_mobile(self) -> None:
-        self.assertEqual(sms_provider.normalize_swedish_mobile("0701234567"), "+46701234567")
-        self.assertEqual(sms_provider.normalize_swedish_mobile("+46701234567"), "+46701234567")
-        self.assertEqual(sms_provider.normalize_swedish_mobile("0046701234567"), "+46701234567")
-        self.assertIsNone(sms_provider.normalize_swedish_mobile("031123456"))
-
-
-if __name__ == "__main__":
-    unittest.main()
+@pytest.fixture(autouse=True)
+def _reset_disabled_log_flag() -> None:
+    sms_provider._twilio_disabled_logged = False
+
+
+def test_module_import_has_no_network_side_effects() -> None:
+    # Execute a fresh copy of the module; the imported one already ran.
+    spec = importlib.util.spec_from_file_location("_sms_provider_import_check", sms_provider.__file__)
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch("urllib.request.urlopen", side_effect=AssertionError("network call on import")):
+        spec.loader.exec_module(module)
+
+
+@pytest.fixture()
+def missing_twilio_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    for name in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_FROM_NUMBER"):
+        monkeypatch.setenv(name, "")
+
+
+@pytest.fixture()
+def mocked_urlopen(monkeypatch: pytest.MonkeyPatch) -> mock.MagicMock:
+    mocked = mock.MagicMock()
+    monkeypatch.setattr(sms_provider.urllib.request, "urlopen", mocked)
+    return mocked
+
+
+@pytest.mark.parametrize("sends", [1, 3])
+def test_send_sms_missing_env_returns_false_and_logs_once(
+    missing_twilio_env: None,
+    mocked_urlopen: mock.MagicMock,
+    caplog: pytest.LogCaptureFixture,
+    sends: int,
+) -> None:
+    with caplog.at_level("WARNING", logger="sms_provider"):
+        results = [sms_provider.send_sms("+46701234567", f"test{i}") for i in range(sends)]
+    assert results == [False] * sends
+    mocked_urlopen.assert_not_called()
+    assert caplog.text.count("missing Twilio env vars") == 1
+
+
+def test_send_sms_posts_form_encoded_body() -> None:
+    response = mock.MagicMock()
+    response.status = 201
+    response.__enter__.return_value = response
+    with mock.patch.dict(
+        os.environ,
+        {
+            "TWILIO_ACCOUNT_SID": "AC123",
+            "TWILIO_AUTH_TOKEN": "token",
+            "TWILIO_FROM_NUMBER": "+46700000000",
+        },
+        clear=False,
+    ):
+        with mock.patch("sms_provider.urllib.request.urlopen", return_value=response) as mocked_urlopen:
+            ok = sms_provider.send_sms("+46701234567", "Bokning & kvitto: 200 kr")
+    assert ok is True
+    request = mocked_urlopen.call_args.args[0]
+    assert request.full_url == "https://api.twilio.com/2010-04-01/Accounts/AC123/Messages.json"
+    assert request.data == b"To=%2B46701234567&From=%2B46700000000&Body=Bokning+%26+kvitto%3A+200+kr"
+    assert request.get_header("Authorization") == "Basic QUMxMjM6dG9rZW4="
+
+
+@pytest.mark.parametrize(
+    ("raw", "expected"),
+    [
+        ("0701234567", "+46701234567"),
+        ("+46701234567", "+46701234567"),
+        ("0046701234567", "+46701234567"),
+        ("070-123 45 67", "+46701234567"),
+        ("031123456", None),
+    ],
+)
+def test_normalize_swedish_mobile(raw: str, expected: str | None) -> None:
+    assert sms_provider.normalize_swedish_mobile(raw) == expected
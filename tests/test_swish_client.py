@@ -0,0 +1,149 @@
+import json
+import os
+import ssl
+import tempfile
+import unittest
+import uuid
+from unittest import mock
+
+import swish_client
+from swish_client import SwishClient, SwishConfig
+
+
+def _live_config(**overrides) -> SwishConfig:
+    values = {
+        "base_url": "https://swish.example.com/",
+        "merchant_alias": "1231181189",
+        "callback_url": "https://example.com/api/swish/callback",
+        "cert_path": "/certs/client.pem",
+        "key_path": "/certs/client.key",
+        "ca_path": "/certs/ca.pem",
+        "mock": False,
+    }
+    values.update(overrides)
+    return SwishConfig(**values)
+
+
+class _FakeResponse:
+    def __init__(self, status: int, data: bytes = b"") -> None:
+        self.status = status
+        self.data = data
+
+
+class SwishClientTest(unittest.TestCase):
+    def setUp(self) -> None:
+        swish_client._mtls_pool_for_files.cache_clear()
+        self.addCleanup(swish_client._mtls_pool_for_files.cache_clear)
+        patcher = mock.patch(
+            "swish_client._build_ssl_context",
+            side_effect=lambda *_args: ssl.create_default_context(),
+        )
+        self._build_ssl_context = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_mock_mode_does_not_touch_the_network(self) -> None:
+        with mock.patch("swish_client.urllib3.PoolManager", side_effect=AssertionError("network in mock mode")):
+            created = SwishClient(_live_config(mock=True)).create_payment_request(100, "DHS TEST")
+        self.assertEqual(len(created.token), 32)
+        self.assertEqual(uuid.UUID(created.instruction_uuid).version, 4)
+        self.assertIn(created.token, created.swish_app_url)
+
+    def test_live_clients_share_one_pool_per_identity(self) -> None:
+        first = SwishClient(_live_config())._http
+        second = SwishClient(_live_config())._http
+        self.assertIs(first, second)
+        self._build_ssl_context.assert_called_once_with("/certs/client.pem", "/certs/client.key", "/certs/ca.pem")
+
+        other = SwishClient(_live_config(ca_path=None))._http
+        self.assertIsNot(first, other)
+        self.assertEqual(self._build_ssl_context.call_count, 2)
+
+    def test_pooled_connections_use_the_prebuilt_context(self) -> None:
+        manager = SwishClient(_live_config())._http
+        pool = manager.connection_from_url("https://swish.example.com/")
+        self.assertIs(pool.conn_kw["ssl_context"], manager.connection_pool_kw["ssl_context"])
+        self.assertIsInstance(pool.conn_kw["ssl_context"], ssl.SSLContext)
+
+    def test_live_mode_requires_cert_and_key(self) -> None:
+        with self.assertRaises(RuntimeError):
+            SwishClient(_live_config(key_path=None))
+        SwishClient(_live_config(key_path=None, mock=True))
+
+    def test_get_payment_request_uses_pooled_connections(self) -> None:
+        manager = swish_client._mtls_pool("/certs/client.pem", "/certs/client.key", "/certs/ca.pem")
+        with mock.patch.object(manager, "request", return_value=_FakeResponse(200, b'{"status": "paid"}')) as mocked:
+            result = SwishClient(_live_config()).get_payment_request("abc")
+        self.assertEqual(result, {"id": "abc", "status": "PAID"})
+        mocked.assert_called_once_with(
+            "GET",
+            "https://swish.example.com/api/v2/paymentrequests/abc",
+            headers={"Accept": "application/json"},
+            timeout=10,
+        )
+
+    def test_pool_is_rebuilt_when_certificates_are_rotated_in_place(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cert_path = os.path.join(tmpdir, "client.pem")
+            key_path = os.path.join(tmpdir, "client.key")
+            for path in (cert_path, key_path):
+                with open(path, "w", encoding="utf-8") as handle:
+                    handle.write("old")
+            first = swish_client._mtls_pool(cert_path, key_path, None)
+            self.assertIs(swish_client._mtls_pool(cert_path, key_path, None), first)
+
+            stat = os.stat(cert_path)
+            os.utime(cert_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            self.assertIsNot(swish_client._mtls_pool(cert_path, key_path, None), first)
+
+    def test_pool_does_not_retry_requests(self) -> None:
+        manager = swish_client._mtls_pool("/certs/client.pem", "/certs/client.key", "/certs/ca.pem")
+        self.assertIs(manager.connection_pool_kw["retries"].total, False)
+
+    def test_create_payment_request_puts_compact_utf8_body(self) -> None:
+        manager = swish_client._mtls_pool("/certs/client.pem", "/certs/client.key", "/certs/ca.pem")
+        message = "Släpvagn " + "ö" * 60
+        with mock.patch.object(manager, "request", return_value=_FakeResponse(201)) as mocked:
+            created = SwishClient(_live_config()).create_payment_request(250, message)
+        method, endpoint = mocked.call_args.args
+        body = mocked.call_args.kwargs["body"]
+        self.assertEqual(method, "PUT")
+        self.assertTrue(endpoint.endswith(f"/api/v2/paymentrequests/{created.instruction_uuid}"))
+        self.assertNotIn(b", ", body)
+        payload = json.loads(body)
+        self.assertEqual(payload["message"], message[:50])
+        self.assertEqual(payload["amount"], "250")
+        self.assertEqual(payload["payeeAlias"], "1231181189")
+        self.assertEqual(payload["payeePaymentReference"], created.instruction_uuid)
+
+    def test_get_qr_svg_embeds_token(self) -> None:
+        svg = SwishClient(_live_config(mock=True)).get_qr_svg("abc123")
+        self.assertTrue(svg.startswith("<svg xmlns='http://www.w3.org/2000/svg'"))
+        self.assertIn("<text x='10' y='100'>token:abc123</text>", svg)
+
+    def test_warm_up_skips_mock_mode(self) -> None:
+        self.assertIsNone(swish_client.warm_up(_live_config(mock=True)))
+        self.assertIsNone(swish_client.warm_up(_live_config(cert_path=None)))
+
+    def test_warm_up_opens_a_pooled_connection_in_background(self) -> None:
+        manager = swish_client._mtls_pool("/certs/client.pem", "/certs/client.key", "/certs/ca.pem")
+        with mock.patch.object(manager, "request") as mocked:
+            thread = swish_client.warm_up(_live_config())
+            thread.join(timeout=2)
+        mocked.assert_called_once_with("HEAD", "https://swish.example.com/", timeout=10)
+
+    def test_warm_up_logs_certificate_errors_instead_of_raising(self) -> None:
+        self._build_ssl_context.side_effect = FileNotFoundError("/certs/client.pem")
+        with self.assertLogs("swish_client", level="WARNING") as logs:
+            thread = swish_client.warm_up(_live_config())
+            thread.join(timeout=2)
+        self.assertIn("SWISH_WARMUP_FAILED", logs.output[0])
+
+    def test_error_status_raises_with_body_excerpt(self) -> None:
+        manager = swish_client._mtls_pool("/certs/client.pem", "/certs/client.key", "/certs/ca.pem")
+        with mock.patch.object(manager, "request", return_value=_FakeResponse(422, b"invalid payee")):
+            with self.assertRaisesRegex(RuntimeError, "422 invalid payee"):
+                SwishClient(_live_config()).get_payment_request("abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
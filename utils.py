@@ -38,11 +38,18 @@ def to_svg_str(qr: QrCode, border: int = 4) -> str:
         raise ValueError("Border must be non‑negative")
     parts: List[str] = []
     size = qr.get_size()
-    # Build up a series of small path commands for each dark module
+    # Build up one path command per horizontal run of dark modules
     for y in range(size):
-        for x in range(size):
-            if qr.get_module(x, y):
-                parts.append(f"M{x + border},{y + border}h1v1h-1z")
+        x = 0
+        while x < size:
+            if not qr.get_module(x, y):
+                x += 1
+                continue
+            run_start = x
+            while qr.get_module(x, y):  # False past the right edge
+                x += 1
+            run = x - run_start
+            parts.append(f"M{run_start + border},{y + border}h{run}v1h-{run}z")
     path_data = " ".join(parts)
     total = size + border * 2
     return (